@@ -0,0 +1,133 @@
+#!/usr/env/python
+
+"""Resolve email addresses to the person ids in addresses_all.txt (written by
+links.indexLinks) without scanning the whole list for every address.
+
+The resolver is built once from the text file and pickled next to it, and rebuilt
+whenever the text file is newer than the pickle.
+"""
+
+import bisect
+import os
+import cPickle as pickle
+import enron
+
+
+class AddressResolver(object):
+
+    """Maps addresses to person ids.
+
+    resolve() tries, in order: the address exactly as given, the normalised address,
+    the normalised local part (before the @), and finally the first stored address
+    starting with the normalised address. The prefix search is a binary search over
+    the sorted addresses, which answers the same queries as a prefix trie with far
+    less memory. When several addresses share a key the smallest id, the first one in
+    addresses_all.txt, is kept.
+
+    This is not the lookup links.matchEmail does: that returns the first address in the
+    file containing the query anywhere, so for the same query it can find an earlier
+    address than the exact, normalised or local part match resolve() prefers."""
+
+    def __init__(self, addresses):
+
+        """addresses is an iterable of (person_id, address)"""
+
+        self.exact = {}
+        self.normalised = {}
+        self.local = {}
+
+        for person_id, address in addresses:
+
+            norm = enron.normaliseAddress(address)
+
+            for table, key in ((self.exact, address), (self.normalised, norm),
+                               (self.local, norm.split('@')[0])):
+
+                if key not in table or person_id < table[key]:
+                    table[key] = person_id
+
+        self.sorted_addresses = sorted(self.normalised)
+        self.sorted_ids = [self.normalised[a] for a in self.sorted_addresses]
+
+    def __len__(self):
+        return len(self.normalised)
+
+    def maxId(self):
+
+        """Largest id resolve() can return, or -1 if there are no addresses"""
+
+        return max([-1]+[max(table.itervalues()) for table in (self.exact, self.normalised, self.local) if table])
+
+    def prefix(self, prefix):
+
+        """Id of the first address in sorted order starting with prefix, or None"""
+
+        i = bisect.bisect_left(self.sorted_addresses, prefix)
+
+        if i < len(self.sorted_addresses) and self.sorted_addresses[i].startswith(prefix):
+            return self.sorted_ids[i]
+
+        return None
+
+    def resolve(self, address):
+
+        """Person id for address, or None if nothing matches"""
+
+        if address in self.exact:
+            return self.exact[address]
+
+        norm = enron.normaliseAddress(address)
+
+        if not norm:
+            return None
+
+        if norm in self.normalised:
+            return self.normalised[norm]
+
+        if norm in self.local:
+            return self.local[norm]
+
+        return self.prefix(norm)
+
+    def save(self, filename):
+
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        return
+
+    @classmethod
+    def fromFile(cls, filename):
+
+        """Build the resolver from the id<tab>"address" lines of addresses_all.txt"""
+
+        addresses = []
+
+        with open(filename, 'r') as f:
+
+            for line in f:
+
+                fields = line.rstrip('\n').split('\t', 1)
+
+                if len(fields) == 2:
+                    addresses.append((int(fields[0]), fields[1].strip('"')))
+
+        return cls(addresses)
+
+def loadResolver(addressfile='addresses_all.txt', cachefile=None):
+
+    """Load the pickled resolver for addressfile, building and saving it first if it
+    is missing or older than addressfile"""
+
+    if cachefile == None:
+        cachefile = os.path.splitext(addressfile)[0]+'.pkl'
+
+    if os.path.exists(cachefile) and os.path.getmtime(cachefile) >= os.path.getmtime(addressfile):
+
+        with open(cachefile, 'rb') as f:
+            return pickle.load(f)
+
+    resolver = AddressResolver.fromFile(addressfile)
+    resolver.save(cachefile)
+
+    return resolver
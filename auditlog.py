@@ -0,0 +1,153 @@
+#!/usr/env/python
+
+"""Buffered writer for the preprocessing audit files (word_replace_dic.csv and
+ngrams_found.csv).
+
+write(fname, lines) only puts the lines on a queue. A background thread collects them
+and appends them to their files every flush_interval seconds, or sooner when a lot
+has built up, so a file is opened once per flush rather than once per email.
+Each process gets its own thread, and the appends take an exclusive lock on the
+file, so several preprocessing workers can write to the same audit file.
+
+setEnabled(False) switches auditing off completely: write() then does nothing.
+"""
+
+import atexit
+import fcntl
+import os
+import threading
+import time
+import Queue
+from multiprocessing import util
+
+
+# Control messages for the writer thread
+_FLUSH = object()
+_STOP = object()
+
+class AuditLog(object):
+
+    def __init__(self, flush_interval=1.0, max_lines=10000):
+        self.enabled = True
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+        self.thread = None
+
+    def start(self):
+
+        """Start the writer thread for this process. Threads do not survive a fork, so
+        a forked worker starts its own the first time it writes"""
+
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.queue = Queue.Queue()
+            self.thread = threading.Thread(target=self.run, name='auditlog')
+            self.thread.daemon = True
+            self.thread.start()
+            self.pid = os.getpid()
+
+        # Pool workers leave through os._exit, which skips atexit but not the multiprocessing finalizers
+        util.Finalize(self, self.close, exitpriority=10)
+
+        return
+
+    def write(self, fname, lines):
+
+        """Queue lines (a list of strings, each ending in a newline) for fname"""
+
+        if not self.enabled or not lines:
+            return
+
+        if self.pid != os.getpid() or not self.thread.is_alive():
+            self.start()
+
+        self.queue.put((fname, lines))
+
+        return
+
+    def flush(self, stop=False):
+
+        """Write everything queued so far and wait until it is on disk.
+        With stop=True the writer thread also finishes"""
+
+        if self.pid != os.getpid() or not self.thread.is_alive():
+            return
+
+        done = threading.Event()
+        self.queue.put((_STOP if stop else _FLUSH, done))
+        done.wait()
+
+        return
+
+    def close(self):
+        self.flush(stop=True)
+
+    def run(self):
+
+        buffers = {}
+        buffered = 0
+        last = time.time()
+        empty = Queue.Empty
+
+        while True:
+
+            try:
+                fname, lines = self.queue.get(timeout=self.flush_interval)
+            except empty:
+                fname, lines = None, None
+
+            if fname != None and fname is not _FLUSH and fname is not _STOP:
+                buffers.setdefault(fname, []).extend(lines)
+                buffered += len(lines)
+                if buffered < self.max_lines and time.time() - last < self.flush_interval:
+                    continue
+
+            for name, pending in buffers.iteritems():
+                appendLines(name, pending)
+
+            buffers = {}
+            buffered = 0
+            last = time.time()
+
+            if fname is _FLUSH or fname is _STOP:
+                lines.set()
+
+            if fname is _STOP:
+                return
+
+def appendLines(fname, lines):
+
+    """Append lines to fname in one write, holding an exclusive lock on the file"""
+
+    with open(fname, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(''.join(lines))
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    return
+
+_log = AuditLog()
+
+def write(fname, lines):
+    _log.write(fname, lines)
+
+def flush():
+    _log.flush()
+
+def close():
+    _log.close()
+
+def setEnabled(enabled=True):
+
+    """Turn auditing on or off. Anything already queued is still written"""
+
+    _log.enabled = enabled
+
+atexit.register(close)
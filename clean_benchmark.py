@@ -0,0 +1,168 @@
+#!/usr/env/python
+
+"""Throughput of the text cleaning in enron.py against the original implementations,
+which are kept here as the reference. Every cleaned email is checked to be identical
+to the reference output before any timings are reported.
+
+To use this at the command line use the following:
+
+python clean_benchmark.py -f 0.01 [-r 3] [-s 123]
+
+-f is the fraction of the rawtext column you want to work on
+-r the number of times each function is run over the sample (the best time is kept)
+-s seed for the random sample
+"""
+
+import argparse
+import math
+import random
+import re
+import time
+import enron
+
+
+def legacyStripCharacters(string, backslash_char = True):
+
+    """The original enron.stripCharacters"""
+
+    newstring = re.sub(r"[\x90-\xff]", '',string)
+
+    if (backslash_char == True):
+        newstring2 = re.sub(r'\r|\n|\t', ' ', newstring)
+    else:
+        newstring2 = newstring
+
+    return newstring2
+
+def legacyCleanString(textstring):
+
+    """The original enron.cleanString"""
+
+    textstring = textstring.lower()
+    textstring = legacyStripCharacters(textstring)
+
+    match = re.search(r'Original Message', textstring)
+
+    if (match==None):
+        textstring = textstring
+    else:
+        textstring = textstring[:match.start()]
+
+    textstring = re.sub(r"[a-z,A-Z,0-9,/]+@+[\w]+", r' ', textstring)
+    textstring = re.sub(r'/HOU/ECT', r'', textstring)
+    textstring = re.sub(r"[a-z,A-Z,0-9,/,.]+@+[\w]+.\w*", r' ', textstring)
+    textstring = re.sub(r"<(|/)\w+>", r' ', textstring)
+    textstring = re.sub(r"(?:http(s)?://|www.)\S+", r'  ', textstring)
+    textstring = re.sub(r"\d{2}(:|\s)\d{2}\s(p|a)m", r' ', textstring)
+    textstring = re.sub(r"\d{2}/\d{2}/\d{4}", r' ', textstring)
+    textstring = re.sub(r"[0-9,a-z,.,_]*.pdf",r' ',textstring)
+    textstring = re.sub(r"[0-9,a-z,.,_]*.doc",r' ',textstring)
+    textstring = re.sub(r"\d{3}(-|\s)\d{3}(-|\s)\d{4}", r'  ', textstring)
+    textstring = re.sub(r"(|\w*)\\[a-z,\\]*", r' ', textstring)
+    textstring = re.sub (r"\b(?=\w*\d)\w+", r'  ', textstring)
+    textstring = re.sub(r"""\[\^~\+=!-\*@#\$<>\.,;:\?!\|\-\(\)/"\'\[\]\{\}\\]""", r'  ' , textstring)
+    textstring = re.sub(r'(.)\1{2,}\w+', r' ', textstring)
+    textstring = re.sub(r'\s\s*', r' ', textstring)
+
+    return textstring
+
+def legacyUltraClean(textstring):
+
+    """The original update_column.ultraClean"""
+
+    textstring = textstring.lower()
+    textstring = legacyStripCharacters(textstring)
+
+    match = re.search(r'Original Message', textstring)
+
+    if (match==None):
+        textstring = textstring
+    else:
+        textstring = textstring[:match.start()]
+
+    textstring = re.sub(r"[a-z,A-Z,0-9,/]+@+[\w]+", r' ', textstring)
+    textstring = re.sub(r'/HOU/ECT', r'', textstring)
+    textstring = re.sub(r"[a-z,A-Z,0-9,/,.]+@+[\w]+.\w*", r' ', textstring)
+    textstring = re.sub(r"<(|/)\w+>", r' ', textstring)
+    textstring = re.sub(r"(?:http(s)?://|www.)\S+", r'  ', textstring)
+    textstring = re.sub(r"\d{2}(:|\s)\d{2}\s(p|a)m", r' ', textstring)
+    textstring = re.sub(r"\d{2}/\d{2}/\d{4}", r' ', textstring)
+    textstring = re.sub(r"[0-9,a-z,.,_]*.pdf",r' ',textstring)
+    textstring = re.sub(r"[0-9,a-z,.,_]*.doc",r' ',textstring)
+    textstring = re.sub(r"\d{3}(-|\s)\d{3}(-|\s)\d{4}", r'  ', textstring)
+    textstring = re.sub('[\^~+=!-*@#$<>.,;:?!|\-\(\)/"\'\[\]]', r' ' , textstring)
+    textstring = re.sub(r'(.)\1{2,}', r' ', textstring)
+
+    return textstring
+
+def sampleRawtext(fraction, seed=None):
+
+    """Random sample of the rawtext column"""
+
+    size = enron.lastId()
+
+    if seed != None:
+        random.seed(seed)
+
+    sample = random.sample(range(1, size+1), int(math.floor(size*fraction)))
+
+    return [text for id, text in enron.streamIds(sample, column='rawtext')]
+
+def timeFunction(function, texts, repeats):
+
+    """Best wall time over repeats of running function over every text"""
+
+    best = None
+
+    for r in range(repeats):
+
+        start = time.time()
+
+        for text in texts:
+            function(text)
+
+        elapsed = time.time() - start
+
+        if best == None or elapsed < best:
+            best = elapsed
+
+    return best
+
+parser = argparse.ArgumentParser(description="Throughput of the text cleaning functions")
+parser.add_argument('-f', '--fraction', help = 'Fraction of the emails to sample', required = True, type=float)
+parser.add_argument('-r', '--repeats', help = 'Number of timed runs over the sample', default = 3, type=int)
+parser.add_argument('-s', '--seed', help = 'Seed for the random sample', default = None, type=int)
+
+def main():
+
+    args = parser.parse_args()
+
+    texts = sampleRawtext(args.fraction, args.seed)
+
+    megabytes = sum(len(t) for t in texts)/1e6
+
+    print '{0} emails, {1:.1f} MB of rawtext'.format(len(texts), megabytes)
+
+    pairs = [
+        ('stripCharacters', legacyStripCharacters, enron.stripCharacters),
+        ('cleanString', legacyCleanString, enron.cleanString),
+        ('ultraClean', legacyUltraClean, enron.ultraClean),
+    ]
+
+    for name, legacy, current in pairs:
+
+        mismatches = sum(1 for t in texts if legacy(t) != current(t))
+
+        if mismatches:
+            print '{0}: {1} emails differ from the reference output'.format(name, mismatches)
+            continue
+
+        legacytime = timeFunction(legacy, texts, args.repeats)
+        currenttime = timeFunction(current, texts, args.repeats)
+
+        print '{0}: reference {1:.2f} MB/s, current {2:.2f} MB/s ({3:.1f}x)'.format(name,
+            megabytes/legacytime, megabytes/currenttime, legacytime/currenttime)
+
+
+if __name__ == '__main__':
+    main()
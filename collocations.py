@@ -0,0 +1,139 @@
+#!/usr/env/python
+
+"""Streaming collocation counts for find_ngrams.py.
+
+NgramCounts holds the counts NLTK's TrigramCollocationFinder.from_words builds
+(words, adjacent pairs, pairs with one word in between and trigrams) as plain
+Counters, so the counts of separate shards of the emails table can be computed
+in separate processes and added together. Pruning the n-grams seen fewer than
+min_count times keeps the counters small; a trigram always has counts at least
+as large in its two bigrams and its skip pair, so pruning all of them with the
+same threshold never removes the counts a surviving trigram is scored with.
+
+bestBigrams ranks by PMI and bestTrigrams by chi-square exactly as
+BigramAssocMeasures.pmi and TrigramAssocMeasures.chi_sq do, so on the same
+tokens the results match specialwords.best_ngrams.
+"""
+
+import math
+from collections import Counter
+
+
+_SMALL = 1e-20
+
+class NgramCounts(object):
+
+    def __init__(self):
+        self.words = Counter()
+        self.bigrams = Counter()
+        self.skipgrams = Counter()
+        self.trigrams = Counter()
+        self.pruned = 0
+
+    def add(self, tokens):
+
+        """Count a stream of tokens. The n-grams do not continue from earlier calls"""
+
+        self.words.update(tokens)
+        self.bigrams.update(zip(tokens, tokens[1:]))
+        self.skipgrams.update(zip(tokens, tokens[2:]))
+        self.trigrams.update(zip(tokens, tokens[1:], tokens[2:]))
+
+        return self
+
+    def merge(self, other):
+
+        self.words.update(other.words)
+        self.bigrams.update(other.bigrams)
+        self.skipgrams.update(other.skipgrams)
+        self.trigrams.update(other.trigrams)
+        self.pruned = max(self.pruned, other.pruned)
+
+        return self
+
+    def size(self):
+        return len(self.bigrams) + len(self.skipgrams) + len(self.trigrams)
+
+    def prune(self, min_count):
+
+        """Drop the n-grams (not the words) counted fewer than min_count times"""
+
+        for counter in (self.bigrams, self.skipgrams, self.trigrams):
+            for ngram in [ngram for ngram, count in counter.iteritems() if count < min_count]:
+                del counter[ngram]
+
+        self.pruned = max(self.pruned, min_count)
+
+        return self
+
+    def bound(self, max_size):
+
+        """Prune with a rising threshold until at most max_size n-grams are left.
+        Returns the threshold used"""
+
+        threshold = max(self.pruned, 1)
+
+        while self.size() > max_size:
+            threshold *= 2
+            self.prune(threshold)
+
+        return threshold
+
+def pmi(n_ii, n_ix, n_xi, n_xx):
+    return math.log(n_ii*n_xx, 2) - math.log(n_ix*n_xi, 2)
+
+def chiSquare(n_iii, n_iix, n_ixi, n_xii, n_ixx, n_xix, n_xxi, n_xxx):
+
+    """TrigramAssocMeasures.chi_sq: the contingency table of the trigram and its
+    expected values from the marginals"""
+
+    n_oii = n_xii - n_iii
+    n_ioi = n_ixi - n_iii
+    n_iio = n_iix - n_iii
+    n_ooi = n_xxi - n_iii - n_oii - n_ioi
+    n_oio = n_xix - n_iii - n_oii - n_iio
+    n_ioo = n_ixx - n_iii - n_ioi - n_iio
+    n_ooo = n_xxx - n_iii - n_oii - n_ioi - n_iio - n_ooi - n_oio - n_ioo
+
+    cont = (n_iii, n_oii, n_ioi, n_ooi, n_iio, n_oio, n_ioo, n_ooo)
+
+    n_all = sum(cont)
+    bits = (1, 2, 4)
+    score = 0.
+
+    for i in range(8):
+        product = 1
+        for j in bits:
+            product *= sum(cont[x] for x in range(8) if (x & j) == (i & j))
+        expected = product / float(n_all ** 2)
+        score += (cont[i] - expected) ** 2 / (expected + _SMALL)
+
+    return score
+
+def bestBigrams(counts, top_n, min_freq):
+
+    """The top_n bigrams seen at least min_freq times, by PMI"""
+
+    words = counts.words
+    n_xx = sum(words.itervalues())
+
+    scored = [(bigram, pmi(n, words[bigram[0]], words[bigram[1]], n_xx))
+              for bigram, n in counts.bigrams.iteritems() if n >= min_freq]
+    scored.sort(key=lambda t: (-t[1], t[0]))
+
+    return [bigram for bigram, score in scored[:top_n]]
+
+def bestTrigrams(counts, top_n, min_freq):
+
+    """The top_n trigrams seen at least min_freq times, by chi-square"""
+
+    words = counts.words
+    bigrams = counts.bigrams
+    n_xxx = sum(words.itervalues())
+
+    scored = [((w1, w2, w3), chiSquare(n, bigrams[(w1, w2)], counts.skipgrams[(w1, w3)], bigrams[(w2, w3)],
+                                       words[w1], words[w2], words[w3], n_xxx))
+              for (w1, w2, w3), n in counts.trigrams.iteritems() if n >= min_freq]
+    scored.sort(key=lambda t: (-t[1], t[0]))
+
+    return [trigram for trigram, score in scored[:top_n]]
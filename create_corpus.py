@@ -8,42 +8,53 @@ from time import time
 import create_dic as dic
 import argparse
 import stemming as stem
+import auditlog
+import stemcache
 import numpy as np
 import tfidf
+import enron
 import kmeans_analysis as Mykmeans
 
 class MyCorpus(object):
-     def __init__(self, dict_name,size=None):
+     def __init__(self, dict_name,size=None,fetchsize=1000,workers=1,store=None):
         self.dict_name = dict_name
+        self.workers = workers
+        self.store = store
         self.dictionary=corpora.Dictionary.load_from_text(dict_name)
-        self.connection = mdb.connect('localhost', 'kpmg1', 's2ds', 'enron')
-        self.cur = self.connection.cursor()
+        self.fetchsize = fetchsize
         if size == None:
-            self.cur.execute("select id from emails order by id desc limit 1;")
-            res = self.cur.fetchall()
-            tmp = [int(col) for row in res for col in row]
-            self.size=tmp[0]
+            self.size=enron.lastId()
         else:
             self.size = size
 
      def __iter__(self):
-        try:
-            for id in range(1,self.size):
-                self.cur.execute(" select text from emails where id = {0} ".format(id))
-                tmp = self.cur.fetchall()
-                text_stem = stem.stemmingString(tmp[0][0], id, stopwords=False)
-                yield self.dictionary.doc2bow(text_stem, allow_update=False)
-        finally:
-            self.connection.close()
+        # Emails with ids 1 to size-1, read fetchsize at a time
+        texts_id = enron.streamTexts(stop=self.size-1, fetchsize=self.fetchsize)
+        if self.store != None:
+            texts_stem = stem.stemmingStored(texts_id, self.store, stopwords=False, workers=self.workers)
+        elif self.workers > 1:
+            texts_stem = stem.stemmingParallel(texts_id, stopwords=False, workers=self.workers)
+        else:
+            texts_stem = ((id, stem.stemmingString(text, id, stopwords=False)) for id, text in texts_id)
+        for id, text_stem in texts_stem:
+            yield self.dictionary.doc2bow(text_stem, allow_update=False)
 
 parser = argparse.ArgumentParser(description="Generating a corpus")
 parser.add_argument("--read", help="Name of the corpus file"
                     , default=None, required=False, type=str)
 parser.add_argument("--stopwords", help="Add stopwords",default=False, action='store_true')
+parser.add_argument("--no-audit", help="Don't write word_replace_dic.csv and ngrams_found.csv", default=False,
+                    action='store_true', dest='no_audit')
+parser.add_argument("--lemma-cache", help="File where the token to lemma cache is kept between runs",
+                    default='lemma_cache.pkl', type=str, dest='lemma_cache')
 parser.add_argument("--minfreq", help="Don't consider words whose frequency in the dictionary is less than or equal to minfreq",
                     default=0,required = False, type=int)
 parser.add_argument('--maxfreq', help = "Don't consider words whose frequency in the dictionary is greater than or equal to maxfreq",
                     default=300000,required = False, type=int)
+parser.add_argument("--tokenstore", help="Keep the stemmed tokens in this directory (see tokenstore.py) and read them back on later runs. "
+                    "Off by default",
+                    default=None, type=str)
+parser.add_argument("--workers", help="Number of processes doing the stemming", default=1, type=int)
 parser.add_argument("--all", help="Create corpus using the whole set of emails",default=False, action='store_true')
 parser.add_argument('--emails', help = 'Number of emails used to build the corpus',
                     default=None,required = False, type=int)
@@ -64,6 +75,12 @@ def main():
     Nemails=args.emails
     stopws=args.stopwords
 
+    if args.no_audit:
+        auditlog.setEnabled(False)
+
+    if stemcache.loadCaches(args.lemma_cache):
+        print "Loaded lemma cache from {0}".format(args.lemma_cache)
+
     if args.all or Nemails==None:
         filename="corpus_min{0}_stopwds{1}_all.mm".format(min,stopws)
     else:
@@ -80,12 +97,20 @@ def main():
         dic.customizeDic(dictionaryname,min,max,stopwords=stopws)
         dictionaryname=dictionaryname+"_freq.txt"
         print "Creating corpus..."
-        dict=corpora.Dictionary.load_from_text(dictionaryname)
         # Create corpus
-        corpus=MyCorpus(dictionaryname,size=Nemails)
+        if args.tokenstore == None:
+            store=None
+        else:
+            store=stem.tokenStore(args.tokenstore, stopwords=False)
+        corpus=MyCorpus(dictionaryname,size=Nemails,workers=args.workers,store=store)
         # Save corpus to a mm file
         corpora.mmcorpus.MmCorpus.serialize(filename, corpus)
         print "Corpus created in {0} secs".format(time()-t0)
+        if store != None:
+            print "Token store {0}: {1} emails read, {2} stemmed".format(store.path, store.hits, store.misses)
+            store.close()
+        stemcache.printStats()
+        stemcache.saveCaches(args.lemma_cache)
 
 
     if args.tfidf:
@@ -7,17 +7,26 @@ from gensim import corpora
 import argparse
 import enron
 import stemming as stem
+import auditlog
+import stemcache
 import re
 import csv
+import hashlib
+import shutil
+import multiprocessing
+import cPickle as pickle
 
 
 from collections import Counter
+from itertools import izip
 
 def replaceAcronymsDict(abbdictname,dictname):
 
     """
     This function replace any acronym found in the corpus dictionary by the corresponding phrase in the abbreviation
     dictionary.
+    Words that end up as the same phrase (an acronym and its phrase, or two acronyms of the same phrase) are merged
+    into one entry, at the position of the first one, with the smallest id and the sum of the frequencies.
     :param abbdictname: name of the abbreviation dictionary
     :param dictname: name of the corpus dictionary
     :return: writes an output file called dictname_abb.txt
@@ -25,51 +34,60 @@ def replaceAcronymsDict(abbdictname,dictname):
 
 #  Open and read the abbreviations dictionary
     with open(abbdictname, 'Ur') as inputfile:
-        abbdict = list(tuple(rec) for rec in csv.reader(inputfile, delimiter=';'))
-        # Create two lists one with the abbreviations and other with the phrases joined by underscores
-        abbs=[entry[0].lower() for entry in abbdict]
-        phjoined=[entry[1].lower().replace(' ','_') for entry in abbdict]
+        # abbreviation -> phrase joined by underscores. The first entry of a repeated abbreviation is kept
+        phrases = {}
+        for entry in csv.reader(inputfile, delimiter=';'):
+            if len(entry) >= 2:
+                phrases.setdefault(entry[0].lower(), entry[1].lower().replace(' ','_'))
 
 # Opern and read the corpus dictionary
+    # new word -> [id, new word, frequency], in the order the words are first found
+    merged = {}
+    order = []
+
     with open(dictname) as dictfile:
-            entries = dictfile.readlines()
-            entries=[t.strip('\n') for t in entries]
-            entries=[entry.split() for entry in entries]
-            # Create three separate lists from the file
-            ids=[entry[0] for entry in entries]
-            words=[entry[1] for entry in entries]
-            freq=[entry[2] for entry in entries]
-
-    # Look for the abbreviations which are found in the corpus dictionary (to avoid going through the whole list)
-    setabbs=set(abbs)
-    setwords=set(words)
-    common=list(setwords&setabbs)
-
-    # Create an empty list where we will store the new set of words
-    newwords=[]
-
-    # Find and replace abbreviations and acronyms
-    for word in words:
-        if word in common:
-            newwords.append(phjoined[abbs.index(word)])
-        else:
-            newwords.append(word)
+        for line in dictfile:
+            entry = line.split()
+            if len(entry) < 3:
+                continue
+            id, word, freq = entry[0], entry[1], entry[2]
+
+            # Find and replace abbreviations and acronyms
+            word = phrases.get(word, word)
+
+            if word in merged:
+                found = merged[word]
+                found[0] = min(found[0], id, key=int)
+                found[2] = str(int(found[2]) + int(freq))
+            else:
+                merged[word] = [id, word, freq]
+                order.append(word)
 
     # Append _abb to our input dictionary name
     outname=dictname.split(".")[0]+'_abb.'+dictname.split(".")[1]
-    # Remove preexisting modified dictionary
-    if os.path.exists(outname):
-            os.remove(outname)
 
     # Write the results in our new dictionary
-    outfile = open(outname, 'a+')
-    for i in range(len(words)):
-        outfile.writelines("{0} {1} {2} \n".format(ids[i].ljust(6),newwords[i].ljust(7),freq[i].ljust(0)))
-    outfile.close()
+    with open(outname, 'w') as outfile:
+        outfile.write(''.join("{0} {1} {2} \n".format(id.ljust(6),word.ljust(7),freq.ljust(0))
+                              for id, word, freq in (merged[w] for w in order)))
 
     return
 
-def customizeDic(dictionaryname,minfreq, maxfreq, stopwords=False):
+# Relics in the database: repeated character words, backslash words, words longer than 20 characters
+# and words starting with an underscore
+RELICS = re.compile(r'(.)\1{2,}\w+|\\|[a-z]{20,}|\b_\w+')
+
+def fileHash(filename):
+
+    """md5 of the contents of a file"""
+
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def customizeDic(dictionaryname,minfreq, maxfreq, stopwords=False, source="dictionary_freq.txt", cachedir="dic_cache"):
 
     """
     This function loads an existing dictionary called "dictionary_freq.txt" and reduces its
@@ -77,52 +95,54 @@ def customizeDic(dictionaryname,minfreq, maxfreq, stopwords=False):
      frequency parameter freq) and/or
     :param freq: lowest number of documents where the word was found
     :return: returns the new reduced dictionary
-    """
 
-    # Load dictionary
-    dic=corpora.Dictionary.load_from_text("dictionary_freq.txt")
+    The reduced dictionary is kept in cachedir under a key made of the contents of the source dictionary,
+    minfreq, maxfreq and the stopwords, and copied from there when the same reduction is asked for again.
+    """
 
-    # Create a list with the words that appear in less than N documents given by freq
-    minfreq_ids = [tokenid for tokenid, docfreq in dic.dfs.iteritems() if docfreq <= minfreq]
-    maxfreq_ids = [tokenid for tokenid, docfreq in dic.dfs.iteritems() if docfreq >= maxfreq]
+    filename1=dictionaryname+"_words.txt"
+    filename2=dictionaryname+"_freq.txt"
 
     if stopwords == True:
         # Load the stopwords list
-        stoplist = enron.getCustomStopwords()
-        # Create a list with the ids of the words in the stopwords list
-        stop_ids = [dic.token2id[stopword] for stopword in stoplist
-                    if stopword in dic.token2id]
-        dic.filter_tokens(minfreq_ids + maxfreq_ids + stop_ids)
-    elif stopwords == False:
-        # Eliminate non desired entries in our dictionary
-        dic.filter_tokens(minfreq_ids + maxfreq_ids)
-
-    #use re to remove some relics in the database
+        stoplist = set(enron.getCustomStopwords())
+    else:
+        stoplist = set()
 
-    myre1 = re.compile(r'(.)\1{2,}\w+')       #repeated character words
-    myre2 = re.compile(r'(|\w*)\\[a-z,\\]*')  #backslash words
-    myre3 = re.compile(r'[a-z]{20,}')         #words longer than 20 characters
-    myre4 = re.compile(r'\b_\w+')
+    key = hashlib.md5(repr((fileHash(source), minfreq, maxfreq, stopwords == True, sorted(stoplist)))).hexdigest()
+    cached1 = os.path.join(cachedir, key+"_words.txt")
+    cached2 = os.path.join(cachedir, key+"_freq.txt")
 
-    words1 = [dic.token2id[i] for i in dic.token2id.keys() if myre1.search(i)]
-    words2 = [dic.token2id[i] for i in dic.token2id.keys() if myre2.search(i)]
-    words3 = [dic.token2id[i] for i in dic.token2id.keys() if myre3.search(i)]
-    words4 = [dic.token2id[i] for i in dic.token2id.keys() if myre4.search(i)]
+    if os.path.exists(cached1) and os.path.exists(cached2):
+        print "Using the reduced dictionary cached in {0}".format(cached2)
+        shutil.copyfile(cached1, filename1)
+        shutil.copyfile(cached2, filename2)
+        return corpora.Dictionary.load_from_text(filename2)
 
+    # Load dictionary
+    dic=corpora.Dictionary.load_from_text(source)
 
-    allwords = list(set(words1+words2+words3+words4))
+    # One pass over the vocabulary: words found in too few or too many documents, stopwords and relics
+    dfs = dic.dfs
+    relic = RELICS.search
+    badids = [tokenid for word, tokenid in dic.token2id.iteritems()
+              if (tokenid in dfs and (dfs[tokenid] <= minfreq or dfs[tokenid] >= maxfreq))
+              or word in stoplist or relic(word)]
 
-    dic.filter_tokens(allwords)
+    dic.filter_tokens(badids)
 
     # Assign new ids to the remaining words to adjust for the reduced vocabulary
     dic.compactify()
 
     # Save the new dictionary for reference
-    filename1=dictionaryname+"_words.txt"
-    filename2=dictionaryname+"_freq.txt"
     dic.save_as_text(filename1, sort_by_word=True)
     dic.save_as_text(filename2, sort_by_word=False)
-    
+
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    shutil.copyfile(filename1, cached1)
+    shutil.copyfile(filename2, cached2)
+
     return dic
 
 def initializeDic(N, stopwords=False):
@@ -134,21 +154,8 @@ def initializeDic(N, stopwords=False):
 
     print "Initializing dictionary with the first {0} emails \n".format(N-1)
 
-    # Open the connection to the DB
-    connection = mdb.connect('localhost', 'kpmg1', 's2ds', 'enron')
-    cur = connection.cursor()
-
-    texts = []
-    ids = []
-
-    # Query emails for given ids
-    for id in range(1, N):
-        cur.execute(" select text from emails where id = {0} ".format(id))
-        tmp = cur.fetchall()
-        texts.append(tmp[0][0])
-        ids.append(id)
-
-    texts_id = zip(ids, texts)
+    # Query emails for ids 1 to N-1
+    texts_id = list(enron.streamTexts(stop=N-1))
     # Apply stemming to the given text
     texts_stem = stem.stemmingListofStrings(texts_id,stopwords=stopwords)
     texts_stem = [text for id, text in texts_stem]
@@ -158,6 +165,238 @@ def initializeDic(N, stopwords=False):
 
     return dictionary
 
+def countShard(shard):
+    """
+    Worker for buildParallel: stems the emails with start < id <= stop and returns what the reducer needs
+    to add them to the dictionary exactly as doc2bow(allow_update=True) would, one email at a time:
+    ((groups, dfs, num_docs, num_pos, num_nnz), new stem cache entries (see stemcache.takeNew))
+    groups has, for each email with words not seen before in the shard, all the words of the email in the
+    order they first appear in it. doc2bow numbers the new words of an email in the iteration order of a
+    dict built from the email, which depends on that order, so replaying the groups of the shards in order
+    through doc2bow gives the words the same ids as a serial build.
+    dfs counts the emails of the shard each word appears in
+    """
+
+    start, stop, stopwords, storedir = shard
+
+    texts_id = enron.streamTexts(start=start, stop=stop)
+    if storedir != None:
+        store = stem.tokenStore(storedir, stopwords=stopwords)
+        texts_stem = stem.stemmingStored(texts_id, store, stopwords=stopwords)
+    else:
+        texts_stem = ((id, stem.stemmingString(text, id, stopwords=stopwords)) for id, text in texts_id)
+
+    seen = set()
+    groups = []
+    dfs = Counter()
+    num_docs = num_pos = num_nnz = 0
+
+    for id, text_stem in texts_stem:
+        # doc2bow keys the dictionary by unicode. Repeated words do not change the order of its dict,
+        # so only the first occurrence of each word is kept
+        words = set()
+        ordered = []
+        for w in text_stem:
+            w = w if isinstance(w, unicode) else unicode(w, 'utf-8')
+            if w not in words:
+                words.add(w)
+                ordered.append(w)
+        if not words <= seen:
+            groups.append(ordered)
+            seen.update(words)
+        dfs.update(words)
+        num_docs += 1
+        num_pos += len(text_stem)
+        num_nnz += len(words)
+
+    if storedir != None:
+        store.close()
+
+    return (groups, dfs, num_docs, num_pos, num_nnz), stemcache.takeNew()
+
+def mergeShard(dictionary, shard):
+    """
+    Reducer for buildParallel: adds the counts of one shard (see countShard) to the dictionary
+    """
+
+    groups, dfs, num_docs, num_pos, num_nnz = shard
+
+    before = (dictionary.num_docs, dictionary.num_pos, dictionary.num_nnz)
+
+    # New words get their ids in the same order as in a serial build
+    replayed = Counter()
+    for group in groups:
+        dictionary.doc2bow(group, allow_update=True)
+        replayed.update(group)
+
+    # The replay counted each word once for every group it is in.
+    # Replace that by the number of emails it was really found in
+    token2id = dictionary.token2id
+    for word, count in dfs.iteritems():
+        tokenid = token2id[word]
+        dictionary.dfs[tokenid] += count - replayed[word]
+
+    dictionary.num_docs = before[0] + num_docs
+    dictionary.num_pos = before[1] + num_pos
+    dictionary.num_nnz = before[2] + num_nnz
+
+    return dictionary
+
+class Checkpoint(object):
+    """
+    Binary checkpoints of a dictionary being built, so a run that stops can be resumed without rewriting
+    the whole dictionary as text every 1000 emails.
+    start() writes the full dictionary once. After that each save() appends only what changed since the
+    previous one: the last id done, the words added (in id order), the document frequency increments and
+    the totals. load() replays the records, ignoring a last record cut short by a crash.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.outfile = None
+
+    def start(self, dictionary, meta):
+        """Write the base record: meta (a dict of the build options) and the dictionary as it is now"""
+
+        self.outfile = open(self.filename, 'wb')
+        self.dump({'meta': meta, 'token2id': dictionary.token2id, 'dfs': dictionary.dfs,
+                   'num_docs': dictionary.num_docs, 'num_pos': dictionary.num_pos, 'num_nnz': dictionary.num_nnz})
+        self.reset(dictionary)
+
+    def reset(self, dictionary):
+        self.size = len(dictionary.token2id)
+        self.new = {}
+        self.dfs = Counter()
+
+    def dump(self, record):
+        pickle.dump(record, self.outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        self.outfile.flush()
+
+    def update(self, dictionary, document, bow):
+        """Record an email added with bow = dictionary.doc2bow(document, allow_update=True)"""
+
+        for tokenid, count in bow:
+            self.dfs[tokenid] += 1
+            if tokenid >= self.size and tokenid not in self.new:
+                self.newWords(dictionary, document)
+
+    def updateShard(self, dictionary, shard):
+        """Record a shard added with mergeShard"""
+
+        groups, dfs, num_docs, num_pos, num_nnz = shard
+        token2id = dictionary.token2id
+
+        for group in groups:
+            for word in group:
+                tokenid = token2id[word]
+                if tokenid >= self.size:
+                    self.new[tokenid] = word
+
+        for word, count in dfs.iteritems():
+            self.dfs[token2id[word]] += count
+
+    def newWords(self, dictionary, document):
+        token2id = dictionary.token2id
+        for word in document:
+            word = word if isinstance(word, unicode) else unicode(word, 'utf-8')
+            tokenid = token2id.get(word)
+            if tokenid != None and tokenid >= self.size:
+                self.new[tokenid] = word
+
+    def save(self, dictionary, lastid):
+        """Append what changed since the last save"""
+
+        self.dump({'lastid': lastid, 'new': [self.new[i] for i in range(self.size, len(dictionary.token2id))],
+                   'dfs': dict(self.dfs), 'num_docs': dictionary.num_docs, 'num_pos': dictionary.num_pos,
+                   'num_nnz': dictionary.num_nnz})
+        self.reset(dictionary)
+
+    def load(self):
+        """Rebuild the dictionary from the checkpoint file and reopen it for appending.
+        Returns (dictionary, meta, last id done)"""
+
+        dictionary = corpora.Dictionary()
+        meta = None
+        lastid = None
+        good = 0
+
+        with open(self.filename, 'rb') as infile:
+            while True:
+                try:
+                    record = pickle.load(infile)
+                except (EOFError, pickle.UnpicklingError, ValueError, KeyError, IndexError):
+                    break
+                good = infile.tell()
+                if 'meta' in record:
+                    meta = record['meta']
+                    lastid = meta['start']
+                    dictionary.token2id = record['token2id']
+                    dictionary.dfs = record['dfs']
+                else:
+                    lastid = record['lastid']
+                    for word in record['new']:
+                        dictionary.token2id[word] = len(dictionary.token2id)
+                    for tokenid, count in record['dfs'].iteritems():
+                        dictionary.dfs[tokenid] = dictionary.dfs.get(tokenid, 0) + count
+                dictionary.num_docs = record['num_docs']
+                dictionary.num_pos = record['num_pos']
+                dictionary.num_nnz = record['num_nnz']
+
+        if meta == None:
+            raise ValueError("No checkpoint found in {0}".format(self.filename))
+
+        # id2token is rebuilt from token2id the next time it is needed
+        if hasattr(dictionary, 'id2token'):
+            dictionary.id2token = {}
+
+        # Drop a record cut short and carry on appending
+        self.outfile = open(self.filename, 'r+b')
+        self.outfile.truncate(good)
+        self.outfile.seek(good)
+        self.reset(dictionary)
+
+        return dictionary, meta, lastid
+
+    def close(self):
+        if self.outfile != None:
+            self.outfile.close()
+
+def buildParallel(dictionary, start, stop, stopwords=False, workers=None, shardsize=5000, storedir=None,
+                  checkpoint=None):
+    """
+    Adds the emails with start < id <= stop to the dictionary. Worker processes stem and count shards of
+    shardsize ids (countShard) and this process merges them in id order (mergeShard), so the result is
+    the same as calling doc2bow on every email in turn. A checkpoint is saved after each shard
+    """
+
+    shards = [(first, min(first+shardsize, stop), stopwords, storedir) for first in range(start, stop, shardsize)]
+
+    pool = multiprocessing.Pool(processes = workers, initializer = stemcache.trackNew)
+
+    try:
+
+        for shard, (counts, new) in izip(shards, pool.imap(countShard, shards)):
+            # so the lemma cache saved at the end has what the workers stemmed
+            stemcache.mergeNew(new)
+            mergeShard(dictionary, counts)
+            if checkpoint != None:
+                checkpoint.updateShard(dictionary, counts)
+                checkpoint.save(dictionary, shard[1])
+                print 'Checkpoint saved until id = {0}'.format(shard[1])
+
+        pool.close()
+
+    except:
+
+        pool.terminate()
+        raise
+
+    finally:
+
+        pool.join()
+
+    return dictionary
+
 parser = argparse.ArgumentParser(description="Generating a dictionary")
 parser.add_argument('-N', '--Ndic', help = 'Number of texts considered for initial dictionary'
                     ,default=3,required = False, type=int)
@@ -165,6 +404,19 @@ parser.add_argument('-dic', '--initialize', help='initialize dictionary', defaul
 parser.add_argument('--append', help='append word mapping to existing file', default=False,
                     action='store_true')
 parser.add_argument("--stopwords", help="Add stopwords",default=False, action='store_true')
+parser.add_argument("--no-audit", help="Don't write word_replace_dic.csv and ngrams_found.csv", default=False,
+                    action='store_true', dest='no_audit')
+parser.add_argument("--lemma-cache", help="File where the token to lemma cache is kept between runs",
+                    default='lemma_cache.pkl', type=str, dest='lemma_cache')
+parser.add_argument("--tokenstore", help="Keep the stemmed tokens in this directory (see tokenstore.py) and read them back on later runs. "
+                    "Off by default",
+                    default=None, type=str)
+parser.add_argument("--workers", help="Number of processes building the dictionary", default=1, type=int)
+parser.add_argument("--shard", help="Number of ids each worker process counts at a time", default=5000, type=int)
+parser.add_argument("--checkpoint", help="File for the binary checkpoints of the dictionary",
+                    default='dictionary_checkpoint.pkl', type=str)
+parser.add_argument("--resume", help="Carry on from the last checkpoint of an interrupted run", default=False,
+                    action='store_true')
 parser.add_argument("--all", help="Create a dictionary using the whole set of emails",default=False, action='store_true')
 parser.add_argument('-emails', '--emails', help = 'Number of emails used to build the dictionary',
                     required = False, type=int)
@@ -189,51 +441,86 @@ def main():
 
     start_code = time.time()
 
+    if args.no_audit:
+        auditlog.setEnabled(False)
+
+    if stemcache.loadCaches(args.lemma_cache):
+        print "Loaded lemma cache from {0}".format(args.lemma_cache)
+
     # Remove files which will be generated within this function to avoid appending to an existing file unless
     # there is an argument which explicitly requires append to existing file
-    if (args.append == False):
+    if (args.append == False and args.resume == False):
         if os.path.exists("word_replace_dic.csv"):
             os.remove("word_replace_dic.csv")
         if os.path.exists("ngrams_found.csv"):
             os.remove("ngrams_found.csv")
 
-    # Open the connection to the DB
-    connection = mdb.connect('localhost', 'kpmg1', 's2ds', 'enron')
-    cur = connection.cursor()
-
     if all == True:
         # In our case the IDs are ordered by entry. Otherwise you could do:
         # cur.execute("SELECT COUNT(*) FROM emails;")
         # The last ID number gives us the number of rows of the table.
-        cur.execute("select id from emails order by id desc limit 1;")
-        res = cur.fetchall()
-        size = [int(col) for row in res for col in row]
-        Nemails=size[0]
+        Nemails=enron.lastId()
     elif all == False:
         Nemails=args.emails
 
-    # Initialize the dictionary or reads it from file
-    if (args.initialize == True):
-        dictionary = initializeDic(N,stopwords=stopws)
+    checkpoint = Checkpoint(args.checkpoint)
+
+    # Carry on from the checkpoint, initialize the dictionary or read it from file
+    if (args.resume == True):
+        dictionary, meta, start = checkpoint.load()
+        if meta['stopwords'] != stopws:
+            parser.error("The checkpoint was made with --stopwords={0}".format(meta['stopwords']))
+        print 'Resuming from the checkpoint after id = {0}'.format(start)
     else:
-        dictionary = corpora.Dictionary.load_from_text("dictionary_words.txt")
+        if (args.initialize == True):
+            dictionary = initializeDic(N,stopwords=stopws)
+        else:
+            dictionary = corpora.Dictionary.load_from_text("dictionary_words.txt")
+        start = N-1
+        checkpoint.start(dictionary, {'start': start, 'stopwords': stopws})
 
     # Here we go: construct the dictionary and the word-frequency mapping for each email
-    for id in range(N, Nemails+1):
-        cur.execute(" select text from emails where id = {0} ".format(id))
-        tmp = cur.fetchall()
-        text_stem = stem.stemmingString(tmp[0][0], id,stopwords=stopws)
-        dictionary.doc2bow(text_stem, allow_update=True)
-        # Save dictionary once in a while to make sure we don't loose everything if some error ocurrs
-        if id % 1000 == 0 or id == (Nemails):
-            dictionary.save_as_text("dictionary_words.txt", sort_by_word=True)
-            dictionary.save_as_text("dictionary_freq.txt", sort_by_word=False)
-            print 'Dictionary saved until id = {0}'.format(id)
+    id = start
+    if args.workers > 1:
+        # Map-reduce build, see buildParallel. Nothing is left for the loop below
+        if Nemails == None:
+            Nemails = enron.lastId()
+        storedir = args.tokenstore
+        buildParallel(dictionary, start, Nemails, stopwords=stopws, workers=args.workers, shardsize=args.shard,
+                      storedir=storedir, checkpoint=checkpoint)
+        id = Nemails
+        texts_stem = []
+    elif args.tokenstore != None:
+        store = stem.tokenStore(args.tokenstore, stopwords=stopws)
+        texts_stem = stem.stemmingStored(enron.streamTexts(start=start, stop=Nemails), store, stopwords=stopws)
+    else:
+        texts_stem = ((id, stem.stemmingString(text, id, stopwords=stopws))
+                      for id, text in enron.streamTexts(start=start, stop=Nemails))
+    for id, text_stem in texts_stem:
+        bow = dictionary.doc2bow(text_stem, allow_update=True)
+        checkpoint.update(dictionary, text_stem, bow)
+        # Checkpoint once in a while to make sure we don't loose everything if some error ocurrs
+        if id % 1000 == 0:
+            checkpoint.save(dictionary, id)
+            print 'Checkpoint saved until id = {0}'.format(id)
+
+    checkpoint.save(dictionary, id)
+    checkpoint.close()
+
+    # The text files are only written once, at the end
+    dictionary.save_as_text("dictionary_words.txt", sort_by_word=True)
+    dictionary.save_as_text("dictionary_freq.txt", sort_by_word=False)
+    print 'Dictionary saved until id = {0}'.format(id)
+
+    if args.workers == 1 and args.tokenstore != None:
+        print 'Token store {0}: {1} emails read, {2} stemmed'.format(store.path, store.hits, store.misses)
+        store.close()
 
     replaceAcronymsDict("dic_enron.csv","dictionary_freq.txt")
     replaceAcronymsDict("dic_enron.csv","dictionary_words.txt")
 
-    connection.close()
+    stemcache.printStats()
+    stemcache.saveCaches(args.lemma_cache)
 
     end_code = time.time()
 
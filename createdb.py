@@ -11,10 +11,76 @@ import re
 import pdb
 import datetime
 import hashlib
+import multiprocessing
+import tempfile
+import time
 import enron
+from collections import deque
+from itertools import islice
 
 parser = argparse.ArgumentParser("Create database from email files")
 parser.add_argument("startdir", type = str, help='Starting place for directory tree')
+parser.add_argument("-w", "--workers", type = int, default = 1,
+                    help='Number of processes parsing the files. 1 (default) runs the original serial ingest')
+parser.add_argument("-b", "--batch", type = int, default = 100,
+                    help='Number of rows sent in each executemany (keep the batch under max_allowed_packet)')
+parser.add_argument("-c", "--commit-every", type = int, default = 1000, dest = 'commit_every',
+                    help='Number of rows between commits (and per LOAD DATA with --bulk)')
+parser.add_argument("--bulk", default = False, action = 'store_true',
+                    help='Stage rows to a TSV file and load them with LOAD DATA LOCAL INFILE')
+parser.add_argument("-i", "--incremental", default = False, action = 'store_true',
+                    help='Only read files that are new or changed since they were recorded in the manifest')
+
+#DB schema. We can amend this however we want as we go.
+#I've written everything as 1 table as that seemed the easiest, but
+# if we want to create more tables that's easy.  Just do:
+# TABLES['newname']= and fill in the new columns in the same format
+#I've added a local file location to be helpful during debugging/creation
+
+TABLES={}
+TABLES['emails'] = (\
+    "CREATE TABLE `emails` (\
+      `id` INT NOT NULL AUTO_INCREMENT,\
+      `sender` varchar(500) NOT NULL,\
+      `to` longtext NOT NULL,\
+      `subject` varchar(500), \
+      `date` datetime NOT NULL,\
+      `cc` longtext,\
+      `bcc` longtext,\
+      `rawtext` longtext NOT NULL,\
+      `text` longtext NOT NULL,\
+      `fileloc` varchar(1000) NOT NULL,\
+      `hash` char(32) DEFAULT NULL,\
+      PRIMARY KEY (id),\
+      UNIQUE KEY `hash` (`hash`)\
+    ) ENGINE=InnoDB;")
+TABLES['manifest'] = (\
+    "CREATE TABLE `manifest` (\
+      `pathhash` char(32) NOT NULL,\
+      `path` varchar(1000) NOT NULL,\
+      `size` BIGINT NOT NULL,\
+      `mtime` DOUBLE NOT NULL,\
+      `hash` char(32),\
+      PRIMARY KEY (pathhash)\
+    ) ENGINE=InnoDB;")
+TABLES['addresses'] = (\
+    "CREATE TABLE `addresses` (\
+      `id` INT NOT NULL AUTO_INCREMENT,\
+      `address` varchar(255) CHARACTER SET utf8 COLLATE utf8_bin NOT NULL,\
+      `local_part` varchar(255) NOT NULL,\
+      PRIMARY KEY (id),\
+      UNIQUE KEY `address` (`address`),\
+      KEY `local_part` (`local_part`)\
+    ) ENGINE=InnoDB;")
+TABLES['email_recipients'] = (\
+    "CREATE TABLE `email_recipients` (\
+      `email_id` INT NOT NULL,\
+      `address_id` INT NOT NULL,\
+      `role` ENUM('from', 'to', 'cc', 'bcc') NOT NULL,\
+      PRIMARY KEY (email_id, address_id, role),\
+      KEY `address_role` (`address_id`, `role`)\
+    ) ENGINE=InnoDB;")
+
 
 def createDB():
 
@@ -25,29 +91,7 @@ def createDB():
     connection = mdb.connect('localhost', 'kpmg1', 's2ds')
     cursor=connection.cursor()
 
-
-    #DB schema. We can amend this however we want as we go.
-    #I've written everything as 1 table as that seemed the easiest, but
-    # if we want to create more tables that's easy.  Just do:
-    # TABLES['newname']= and fill in the new columns in the same format
-    #I've added a local file location to be helpful during debugging/creation
-
     DB_NAME='enron'
-    TABLES={}
-    TABLES['emails'] = (\
-        "CREATE TABLE `emails` (\
-          `id` INT NOT NULL AUTO_INCREMENT,\
-          `sender` varchar(500) NOT NULL,\
-          `to` longtext NOT NULL,\
-          `subject` varchar(500), \
-          `date` datetime NOT NULL,\
-          `cc` longtext,\
-          `bcc` longtext,\
-          `rawtext` longtext NOT NULL,\
-          `text` longtext NOT NULL,\
-          `fileloc` varchar(1000) NOT NULL,\
-          PRIMARY KEY (id)\
-        ) ENGINE=InnoDB;")
 
     #try to create. If not raise exception and exit
 
@@ -112,41 +156,44 @@ def formatDate(datestring):
     formatdate = datetime.datetime.strftime(dateobj, '%Y-%m-%d %H:%M:%S')
     return formatdate
 
-def addDBEntry(connect,cur, tablename, email, filepath):
+def cleanAddresses(field):
 
+    """Strip the (E-mail) and <> relics from an address header"""
 
-    print '**************************'
-    print filepath
+    field = re.sub("(E-mail)", "", field)
+    field = re.sub('<', '', field)
+    field = re.sub('>', '', field)
 
-    sender = mdb.escape_string(enron.stripCharacters(email['From']))
+    return field
+
+def parseEmail(email, filepath, digest=None):
+
+    """Pull the fields we store out of a parsed email and clean them.
+    Returns a tuple in the same order as the columns in INSERT_COLUMNS"""
+
+    sender = enron.stripCharacters(email['From'])
 
     to = email['To']
 
     if (to != None): 
 
-        to = re.sub("(E-mail)", "", to)
-        to = re.sub('<', '', to)
-        to = re.sub('>', '', to)
+        to = cleanAddresses(to)
 
     else:
         to = 'unknown'
 
     to = enron.stripCharacters(to)
-    to = mdb.escape_string(to)
 
     cc = email['X-cc']
 
 
     if (cc != None):
-        cc = re.sub('(E-mail)', '', cc)
-        cc = re.sub('<', '', cc)
-        cc = re.sub('>', '', cc)
+        cc = cleanAddresses(cc)
 
     else:
         cc = ''
 
     cc = enron.stripCharacters(cc)
-    cc = mdb.escape_string(cc)
 
 
 
@@ -154,41 +201,49 @@ def addDBEntry(connect,cur, tablename, email, filepath):
     
     if (bcc != None):
    
-        bcc = re.sub('(E-mail)', '', bcc)
-        bcc = re.sub('<', '', bcc)
-        bcc = re.sub('>', '', bcc)
+        bcc = cleanAddresses(bcc)
 
     else:
         bcc = ''
 
     bcc = enron.stripCharacters(bcc)
-    bcc = mdb.escape_string(bcc)
 
     subject=enron.stripCharacters(email['Subject'])
-    subject = mdb.escape_string(subject)
 
 
     date = email['Date']
   
     formated_date = formatDate(date)
 
-    localfile = filepath
-    
     #keep all the raw text formatting
     rawtext = enron.stripCharacters(email.get_payload(),backslash_char = False)
     
 
     cleantext = enron.cleanString(rawtext)
 
-    rawtext = mdb.escape_string(rawtext)
-    cleantext = mdb.escape_string(cleantext)
+    return (sender, to, formated_date, subject, cc, bcc, rawtext, cleantext, filepath, digest)
+
+INSERT_COLUMNS = "(`sender`, `to`, `date`,`subject`,  `cc`, `bcc`, `rawtext`, `text`, `fileloc`, `hash`)"
+
+def insertQuery(tablename):
+
+    """Parameterised INSERT statement for the rows returned by parseEmail"""
+
+    placeholders = ', '.join(['%s']*len(INSERT_COLUMNS.split(',')))
+
+    return """INSERT INTO {0} {1} VALUES ({2})""".format(tablename, INSERT_COLUMNS, placeholders)
+
+def addDBEntry(connect,cur, tablename, email, filepath, digest=None):
+
+
+    print '**************************'
+    print filepath
+
+    row = parseEmail(email, filepath, digest)
 
     #now create the syntax to add an entry to the db
 
-    query = """INSERT INTO {0} (`sender`, `to`, `date`,`subject`,  `cc`, `bcc`, \
-        `rawtext`, `text`, `fileloc`) VALUES ("{1}", "{2}", "{3}", "{4}", "{5}", "{6}", "{7}", \
-        "{8}","{9}");""".format(tablename, sender, to, formated_date, subject, cc, bcc,\
-         rawtext,cleantext,filepath)
+    query = insertQuery(tablename)
 
     #print query
 
@@ -196,7 +251,7 @@ def addDBEntry(connect,cur, tablename, email, filepath):
 
     try:
 
-        cur.execute(query)
+        cur.execute(query, row)
         connect.commit()
 
         print 'Added file: {0}'.format(filepath)
@@ -213,6 +268,578 @@ def addDBEntry(connect,cur, tablename, email, filepath):
     logfile.close()
     return
 
+#MySQL error code for a row clashing with a unique key
+ER_DUP_ENTRY = 1062
+
+MANIFEST_QUERY = "REPLACE INTO `manifest` (`pathhash`, `path`, `size`, `mtime`, `hash`) VALUES (%s, %s, %s, %s, %s)"
+
+def escapeTSV(field):
+
+    """Escape a field for LOAD DATA's default format (tab separated, backslash escapes)"""
+
+    if field == None:
+        return '\\N'
+
+    return field.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0')
+
+class RowWriter(object):
+
+    """Collects the rows from parseEmail and writes them to the database in batches.
+
+    By default rows are inserted with a parameterised executemany every batchsize rows and
+    committed every commit_every rows. With bulk=True the rows are staged to a tab separated
+    file instead and loaded with LOAD DATA LOCAL INFILE every commit_every rows, which needs
+    a connection opened with local_infile=1.
+    Rows rejected by the unique hash key are written to the duplicate log in both modes.
+    A file is only written to the manifest table once its row is in the database or was
+    found to be a duplicate, so a file whose row failed is read again by the next run."""
+
+    def __init__(self, connect, cur, tablename, logfile, duplicate_log, batchsize=100,
+                 commit_every=1000, bulk=False):
+        self.connect = connect
+        self.cur = cur
+        self.tablename = tablename
+        self.logfile = logfile
+        self.duplicate_log = duplicate_log
+        self.batchsize = batchsize
+        self.commit_every = commit_every
+        self.bulk = bulk
+        self.query = insertQuery(tablename)
+        self.added = 0
+        self.duplicates = 0
+        self.pending = []
+        self.uncommitted = 0
+        self.staged = 0
+        self.staged_rows = []
+        self.stagefile = None
+        self.manifest = []
+        self.pending_entries = []
+        self.staged_entries = []
+        self.stale = []
+        self.failed = set()
+
+    def add(self, row, fileinfo=None):
+
+        """Queue a row. fileinfo is the (filepath, size, mtime) of its file, added to the
+        manifest once the row is stored"""
+
+        entry = manifestEntry(fileinfo, row[-1]) if fileinfo != None else None
+
+        if self.bulk:
+
+            if self.stagefile == None:
+                self.stagefile = tempfile.NamedTemporaryFile(prefix='createdb_', suffix='.tsv', dir='.', delete=False)
+
+            self.stagefile.write('\t'.join(escapeTSV(field) for field in row)+'\n')
+            self.staged+=1
+            self.staged_rows.append((row[-1], row[-2]))
+            self.staged_entries.append(entry)
+
+            if self.staged >= self.commit_every:
+                self.commit()
+
+        else:
+
+            self.pending.append(row)
+            self.pending_entries.append(entry)
+
+            if len(self.pending) >= self.batchsize:
+                self.insert()
+
+                if self.uncommitted >= self.commit_every:
+                    self.commit()
+
+        return
+
+    def record(self, fileinfo, digest):
+
+        """Add a file with no row of its own (a duplicate) to the manifest. Entries are
+        written in the same transaction as the rows added before them, so a crash never
+        leaves a file marked as loaded when its row is not in the database"""
+
+        self.manifest.append(manifestEntry(fileinfo, digest))
+
+        if len(self.manifest) >= self.commit_every:
+            self.commit()
+
+        return
+
+    def remove(self, filepath, digest):
+
+        """Delete the row loaded from filepath when its content was digest, because the
+        file has changed since. Done before any later row is written"""
+
+        self.stale.append(("DELETE FROM {0} WHERE `fileloc` = %s AND `hash` = %s".format(self.tablename),
+            (filepath, digest)))
+
+        return
+
+    def move(self, filepath, newpath, digest):
+
+        """Point the row loaded from filepath when its content was digest at newpath, another
+        file with the same content, because filepath has changed since. Done in the same order
+        as remove()"""
+
+        self.stale.append(("UPDATE {0} SET `fileloc` = %s WHERE `fileloc` = %s AND `hash` = %s".format(self.tablename),
+            (newpath, filepath, digest)))
+
+        return
+
+    def deleteStale(self):
+
+        #one at a time and in order: a row moved to a file can be removed when that file changes too
+        for query, params in self.stale:
+            self.cur.execute(query, params)
+
+        self.stale = []
+
+        return
+
+    def storeEntries(self, entries):
+
+        self.manifest.extend(entry for entry in entries if entry != None)
+
+        return
+
+    def writeManifest(self):
+
+        #duplicates of a row that failed are not in the database either
+        manifest = [entry for entry in self.manifest if entry[4] not in self.failed]
+
+        if manifest:
+            self.cur.executemany(MANIFEST_QUERY, manifest)
+
+        self.manifest = []
+
+        return
+
+    def insert(self):
+
+        """executemany the pending rows, one row at a time if the batch is rejected.
+        Only the files of rows that were stored or rejected as duplicates go in the manifest"""
+
+        self.deleteStale()
+
+        if not self.pending:
+            return
+
+        try:
+
+            self.cur.executemany(self.query, self.pending)
+            self.added += len(self.pending)
+            self.storeEntries(self.pending_entries)
+
+        except mdb.Error:
+
+            #a failed statement is rolled back on its own, so earlier batches in
+            #this transaction are still there. Find the bad rows one by one
+
+            for row, entry in zip(self.pending, self.pending_entries):
+
+                try:
+
+                    try:
+
+                        self.cur.execute(self.query, row)
+                        self.added+=1
+                        self.storeEntries([entry])
+
+                    except mdb.IntegrityError, err:
+
+                        #NOT NULL and foreign key violations are failures, not duplicates
+                        if err.args[0] != ER_DUP_ENTRY:
+                            raise
+
+                        self.duplicate_log.write(row[-1]+'\t'+row[-2]+'\n')
+                        self.duplicates+=1
+                        self.storeEntries([entry])
+
+                except mdb.Error, err:
+
+                    print err
+                    self.logfile.write("Error {0} File {1}\n".format(err, row[-2]))
+                    self.failed.add(row[-1])
+
+        self.uncommitted += len(self.pending)
+        self.pending = []
+        self.pending_entries = []
+
+        return
+
+    def load(self):
+
+        """LOAD DATA the staged file. Rows clashing with the unique hash are ignored, counted
+        and written to the duplicate log. Returns False if the load failed"""
+
+        self.deleteStale()
+
+        if self.stagefile == None:
+            return True
+
+        self.stagefile.close()
+        stagename = self.stagefile.name
+        self.stagefile = None
+
+        staged = self.staged
+        self.staged = 0
+
+        staged_rows = self.staged_rows
+        self.staged_rows = []
+
+        staged_entries = self.staged_entries
+        self.staged_entries = []
+
+        query = """LOAD DATA LOCAL INFILE '{0}' IGNORE INTO TABLE {1} CHARACTER SET latin1 \
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' \
+            {2};""".format(stagename, self.tablename, INSERT_COLUMNS)
+
+        try:
+
+            self.cur.execute(query)
+
+        except mdb.Error, err:
+
+            print err
+            self.logfile.write("Error {0} loading {1}\n".format(err, stagename))
+
+            return False
+
+        finally:
+
+            os.remove(stagename)
+
+        loaded = self.cur.rowcount
+
+        self.added += loaded
+        self.duplicates += staged - loaded
+        self.storeEntries(staged_entries)
+
+        if loaded < staged:
+            self.logIgnored(staged_rows)
+
+        return True
+
+    def logIgnored(self, staged_rows, chunk=1000):
+
+        """Write the staged rows that LOAD DATA IGNORE dropped to the duplicate log. A row was
+        dropped if the row stored with its hash comes from another file"""
+
+        for i in range(0, len(staged_rows), chunk):
+
+            batch = staged_rows[i:i+chunk]
+
+            self.cur.execute("SELECT `hash`, `fileloc` FROM {0} WHERE `hash` IN ({1});".format(self.tablename,
+                ', '.join(['%s']*len(batch))), [digest for digest, filepath in batch])
+
+            stored = dict(self.cur.fetchall())
+
+            for digest, filepath in batch:
+
+                if stored.get(digest, filepath) != filepath:
+                    self.duplicate_log.write(digest+'\t'+filepath+'\n')
+
+        return
+
+    def commit(self):
+
+        """Write out everything waiting, together with its manifest entries, and commit"""
+
+        if self.bulk:
+
+            if not self.load():
+
+                #leave the files out of the manifest so the next run retries them
+                self.manifest = []
+
+        else:
+
+            self.insert()
+
+        self.writeManifest()
+        self.connect.commit()
+        self.uncommitted = 0
+
+        return
+
+    def close(self):
+
+        self.commit()
+
+        return
+
+def manifestEntry(fileinfo, digest):
+
+    """Row of the manifest table for a file"""
+
+    filepath, size, mtime = fileinfo
+
+    return (hashlib.md5(filepath).hexdigest(), filepath, size, mtime, digest)
+
+def addHashColumn(cursor):
+
+    """Add the unique hash column to an emails table created before we stored it.
+    Rows loaded before then have a NULL hash and are not used for deduplication"""
+
+    cursor.execute("SHOW COLUMNS FROM `emails` LIKE 'hash';")
+
+    if not cursor.fetchall():
+
+        print 'Adding hash column to emails'
+        cursor.execute("ALTER TABLE `emails` ADD COLUMN `hash` char(32) DEFAULT NULL, ADD UNIQUE KEY `hash` (`hash`);")
+
+    return
+
+def loadHashes(cursor):
+
+    """Returns the set of message hashes already in the database, so re-runs skip
+    files that were loaded before without rescanning anything"""
+
+    cursor.execute("SELECT `hash` FROM `emails` WHERE `hash` IS NOT NULL;")
+
+    return set(row[0] for row in cursor.fetchall())
+
+def createMissingTables(cursor):
+
+    """Create any table in TABLES that an existing database does not have yet"""
+
+    for name,ddl in TABLES.iteritems():
+
+        cursor.execute(ddl.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1))
+
+    return
+
+def loadManifest(cursor):
+
+    """Returns the manifest as a dict of path: (size, mtime, hash)"""
+
+    cursor.execute("SELECT `path`, `size`, `mtime`, `hash` FROM `manifest`;")
+
+    return dict((row[0], (int(row[1]), float(row[2]), row[3])) for row in cursor.fetchall())
+
+def manifestReferences(manifest):
+
+    """Returns a dict of hash: set of the paths in the manifest with that content"""
+
+    references = {}
+
+    for filepath, (size, mtime, digest) in manifest.iteritems():
+        references.setdefault(digest, set()).add(filepath)
+
+    return references
+
+def walkFiles(startdir):
+
+    """Generator over every file in the directory tree"""
+
+    for dir,subdir,files in os.walk(startdir):
+
+        for ff in files:
+
+            yield os.path.join(dir,ff)
+
+def changedFiles(startdir, manifest, counts):
+
+    """Generator over the files in the tree as (filepath, size, mtime), skipping the ones
+    whose size and modification time match the manifest. counts['unchanged'] is
+    incremented for every file skipped"""
+
+    for filepath in walkFiles(startdir):
+
+        st = os.stat(filepath)
+        fileinfo = (filepath, st.st_size, st.st_mtime)
+
+        entry = manifest.get(filepath)
+
+        if entry != None and entry[0] == st.st_size and entry[1] == st.st_mtime:
+
+            counts['unchanged']+=1
+            continue
+
+        yield fileinfo
+
+def readEmailFile(filepath):
+
+    """Read an email file. Returns the lines and the md5 used to spot duplicates,
+    which ignores the Message-ID and X-Folder headers"""
+
+    with open(filepath, 'r') as efile:
+        msglines = efile.readlines()
+    msg2 = [x for x in msglines if not x.startswith('Message-ID') and not x.startswith('X-Folder')]
+    msg2 = ''.join(msg2)
+    m = hashlib.md5()
+    m.update(msg2)
+
+    return msglines, m.hexdigest()
+
+#hashes already in the database, copied into each worker by initWorker
+known_hashes = set()
+
+def initWorker(hashes):
+
+    """Pool initializer: give each worker the hashes that are already loaded"""
+
+    global known_hashes
+    known_hashes = hashes
+
+    return
+
+def parseFile(fileinfo):
+
+    """Worker for the parallel ingest: read, hash, parse and clean one file.
+    fileinfo is (filepath, size, mtime) from changedFiles.
+    Returns (fileinfo, digest, row, error); row is None if the file could not be parsed
+    or is already in the database"""
+
+    filepath = fileinfo[0]
+
+    try:
+
+        msglines, digest = readEmailFile(filepath)
+
+        if digest in known_hashes:
+
+            return (fileinfo, digest, None, None)
+
+        msg = email.message_from_string(''.join(msglines))
+        row = parseEmail(msg, filepath, digest)
+
+    except Exception as err:
+
+        return (fileinfo, None, None, repr(err))
+
+    return (fileinfo, digest, row, None)
+
+def storeFile(fileinfo, digest, row, writer, duplicate_log, hashes, manifest, references):
+
+    """Hand a parsed file to the writer, or log it as a duplicate and record it in the
+    manifest. references is manifestReferences(manifest), updated in place.
+    If the file changed since it was loaded, its old content is kept in the database
+    while other files in the manifest still have it: its row is moved to one of them,
+    and deleted only when there is none left.
+    Returns 1 if the file was a duplicate, 0 otherwise"""
+
+    filepath = fileinfo[0]
+    duplicate = 0
+
+    if filepath in manifest and manifest[filepath][2] != digest:
+
+        old = manifest[filepath][2]
+        others = references.get(old, set())
+        others.discard(filepath)
+
+        if others:
+            writer.move(filepath, min(others), old)
+        else:
+            references.pop(old, None)
+            writer.remove(filepath, old)
+            hashes.discard(old)
+
+    references.setdefault(digest, set()).add(filepath)
+
+    if digest not in hashes:
+
+        if row == None:
+
+            #a worker skipped it as already loaded, but that row was deleted since
+            msglines, digest = readEmailFile(filepath)
+            row = parseEmail(email.message_from_string(''.join(msglines)), filepath, digest)
+
+        hashes.add(digest)
+        writer.add(row, fileinfo)
+
+        return duplicate
+
+    elif filepath in manifest and manifest[filepath][2] == digest:
+
+        #touched since the last run but the content is the same
+        pass
+
+    else:
+
+        'Duplicate message found {0}'.format(filepath)
+        duplicate_log.write(digest+'\t'+filepath+'\n')
+        duplicate = 1
+
+    writer.record(fileinfo, digest)
+
+    return duplicate
+
+def parseChunk(chunk):
+
+    """Worker for the parallel ingest: parseFile on a list of files"""
+
+    return [parseFile(fileinfo) for fileinfo in chunk]
+
+def parsedFiles(pool, files, workers, chunksize=16):
+
+    """Generator over parseFile of every file, in file order. Files are handed to the pool
+    chunksize at a time and at most 2*workers chunks are in flight, so parsed rows never
+    pile up in memory when the database writer is slower than the workers"""
+
+    files = iter(files)
+    pending = deque()
+
+    while True:
+
+        chunk = list(islice(files, chunksize))
+
+        if chunk:
+            pending.append(pool.apply_async(parseChunk, (chunk,)))
+
+        if not pending:
+            break
+
+        if not chunk or len(pending) >= 2*workers:
+            for result in pending.popleft().get():
+                yield result
+
+def parallelIngest(files, workers, writer, duplicate_log, logfile, hashes, manifest, references):
+
+    """Parse the files with a pool of worker processes while this process does all the
+    inserts through writer. hashes is the set of digests seen so far and is updated in place.
+    Returns the number of duplicates found before reaching the database"""
+
+    duplicate_count = 0
+    seen = 0
+
+    pool = multiprocessing.Pool(processes = workers, initializer = initWorker, initargs = (frozenset(hashes),))
+
+    start = time.time()
+
+    try:
+
+        #results come back in file order, so which copy of a duplicate is kept does not
+        #depend on the timing of the workers
+
+        for fileinfo, digest, row, error in parsedFiles(pool, files, workers):
+
+            seen+=1
+
+            if (error != None):
+
+                logfile.write("Error {0} File {1}\n".format(error, fileinfo[0]))
+                continue
+
+            duplicate_count += storeFile(fileinfo, digest, row, writer, duplicate_log, hashes, manifest, references)
+
+            if seen % 1000 == 0:
+
+                elapsed = time.time() - start
+                print '{0} files read, {1} added ({2:.1f} files/sec)'.format(seen, writer.added, seen/elapsed)
+
+        pool.close()
+
+    except:
+
+        pool.terminate()
+        raise
+
+    finally:
+
+        pool.join()
+
+    return duplicate_count
+
 def main():
  
     args = parser.parse_args()
@@ -227,7 +854,30 @@ def main():
 
 
     createDB()
-    connection, cursor = enron.connectDB('enron')
+
+    if args.bulk:
+        connection, cursor = enron.connectDB('enron', local_infile = 1)
+    else:
+        connection, cursor = enron.connectDB('enron')
+
+    createMissingTables(cursor)
+    addHashColumn(cursor)
+
+    #hashes of everything already loaded. Membership tests on a set are constant time
+    #whereas the old list made the whole ingest O(n^2)
+
+    hashes = loadHashes(cursor)
+
+    print '{0} messages already in the database'.format(len(hashes))
+
+    #the manifest is always read, to delete the old rows of files that changed, but only
+    #used to skip files with --incremental
+
+    manifest = loadManifest(cursor)
+    references = manifestReferences(manifest)
+    print '{0} files in the manifest'.format(len(manifest))
+
+    counts = {'unchanged': 0}
 
 
 
@@ -237,55 +887,63 @@ def main():
     startdir = args.startdir
 
 
-    hashlist=[]
-
     duplicate_log = open('duplicate_log.txt', 'w')
+    logfile = open('logfile', 'a')
 
-    filecount = 0
-    duplicate_count = 0
-
+    writer = RowWriter(connection, cursor, 'emails', logfile, duplicate_log, batchsize = args.batch,
+        commit_every = args.commit_every, bulk = args.bulk)
 
     print 'Walking the directory tree (this takes a while)....'
 
-    for dir,subdir,files in os.walk(startdir):
+    start = time.time()
 
-        for ff in files:
+    files = changedFiles(startdir, manifest if args.incremental else {}, counts)
 
-            filepath = os.path.join(dir,ff)
+    if (args.workers > 1):
 
-            #calculate hash
+        print 'Parsing with {0} worker processes'.format(args.workers)
 
-            with open(filepath, 'r') as efile:
-                msglines = efile.readlines()
-            msg2 = [x for x in msglines if not x.startswith('Message-ID') and not x.startswith('X-Folder')]
-            msg2 = ''.join(msg2)
-            m = hashlib.md5()
-            m.update(msg2)
+        duplicate_count = parallelIngest(files, args.workers, writer, duplicate_log, logfile, hashes, manifest, references)
 
-            if m.hexdigest() not in hashlist:
+    else:
 
-                hashlist.append(m.hexdigest())
+        duplicate_count = 0
 
-                msg = email.message_from_string(''.join(msglines))
+        for fileinfo in files:
 
-                addDBEntry(connection,cursor, 'emails', msg, filepath)
-                filecount+=1
+            filepath = fileinfo[0]
 
+            #calculate hash
 
-            else:
+            msglines, digest = readEmailFile(filepath)
+
+            row = None
 
-                'Duplicate message found {0}'.format(filepath)
-                duplicate_log.write(m.hexdigest()+'\t'+filepath+'\n')
-                duplicate_count+=1
+            if digest not in hashes:
+
+                msg = email.message_from_string(''.join(msglines))
+                row = parseEmail(msg, filepath, digest)
 
+            duplicate_count += storeFile(fileinfo, digest, row, writer, duplicate_log, hashes, manifest, references)
 
+    writer.close()
+
+    elapsed = time.time() - start
+
+    filecount = writer.added
+    duplicate_count += writer.duplicates
 
     connection.close()
     duplicate_log.close()
+    logfile.close()
 
     print '{0} entries added to the database'.format(filecount)
     print '{0} files discounted as duplicates'.format(duplicate_count)
 
+    if args.incremental:
+        print '{0} files unchanged since the last run'.format(counts['unchanged'])
+    print 'Ingest took {0:.1f} sec ({1:.1f} files/sec)'.format(elapsed, (filecount+duplicate_count+counts['unchanged'])/max(elapsed, 1e-6))
+
 
 
 
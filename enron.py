@@ -7,90 +7,155 @@ from nltk.corpus import stopwords
 import random
 import math
 import re
+import string
 
 
+#bytes 0x90-0xff are deleted and \r \n \t turned into spaces with str.translate,
+#which is a single pass in C. Unicode strings still go through the regular expressions
+_STRIP_DELETE = ''.join(chr(i) for i in range(0x90, 0x100))
+_STRIP_SPACES = string.maketrans('\r\n\t', '   ')
+_STRIP_UNICODE = re.compile(r"[\x90-\xff]")
+_STRIP_UNICODE_SPACES = re.compile(r'\r|\n|\t')
+
 def stripCharacters(string, backslash_char = True):
 
     """Strips the weird non-unicode characters that appear in the odd email"""
 
-            
-    newstring = re.sub(r"[\x90-\xff]", '',string)
-
-    if (backslash_char == True):
-        newstring2 = re.sub(r'\r|\n|\t', ' ', newstring)
-    else:
-        newstring2 = newstring
-
-    return newstring2
+    if isinstance(string, unicode):
 
-def cleanString(textstring):
+        newstring = _STRIP_UNICODE.sub('', string)
 
+        if (backslash_char == True):
+            newstring = _STRIP_UNICODE_SPACES.sub(' ', newstring)
 
-    textstring = textstring.lower()
-
-    #first remove all the \n and unicode remnants
-
-    textstring = stripCharacters(textstring)
+        return newstring
 
+    if (backslash_char == True):
+        return string.translate(_STRIP_SPACES, _STRIP_DELETE)
 
-    match = re.search(r'Original Message', textstring)
+    return string.translate(None, _STRIP_DELETE)
 
-    #match.start is the index of the first occurance of the search string. Want the 
-    #message from the beginning to that point
+#The cleaning rules, compiled once. Each rule is (pattern, replacement, triggers) and the
+#pass is skipped when none of the trigger substrings are in the text. All the replacements
+#only delete characters or insert spaces, so a trigger missing at the start of the
+#cleaning stays missing for the rest of it.
 
-    if (match==None):
-        textstring = textstring
-    else:
-        textstring = textstring[:match.start()]
+_DIGITS = tuple('0123456789')
 
+_EMAIL_RULES = [
     #next remove any email addresses
     #sometimes they are not xxx@enron.com, but Name/HOU/ECT@ECT so need to include
     #internal messages
-    textstring = re.sub(r"[a-z,A-Z,0-9,/]+@+[\w]+", r' ', textstring)
-    textstring = re.sub(r'/HOU/ECT', r'', textstring)
-    
+    (re.compile(r"[a-z,A-Z,0-9,/]+@+[\w]+"), r' ', ('@',)),
+    (re.compile(r'/HOU/ECT'), r'', ('/HOU/ECT',)),
     #proper emails
-    textstring = re.sub(r"[a-z,A-Z,0-9,/,.]+@+[\w]+.\w*", r' ', textstring)
+    (re.compile(r"[a-z,A-Z,0-9,/,.]+@+[\w]+.\w*"), r' ', ('@',)),
     #relic html tags
-    textstring = re.sub(r"<(|/)\w+>", r' ', textstring)
+    (re.compile(r"<(|/)\w+>"), r' ', ('<',)),
     #websites
     #this isn't going to be perfect but I think it's good enough in this case
     #there are pages of discussions about what to do with regex to extract
     #urls on the internet and none of them work on everything
     #this works on anything starting http(s) or www.
-    textstring = re.sub(r"(?:http(s)?://|www.)\S+", r'  ', textstring)
-
+    (re.compile(r"(?:http(s)?://|www.)\S+"), r'  ', ('http', 'www')),
     #times
+    (re.compile(r"\d{2}(:|\s)\d{2}\s(p|a)m"), r' ', _DIGITS),
+    #dates
+    (re.compile(r"\d{2}/\d{2}/\d{4}"), r' ', _DIGITS),
+    #attachment names
+    (re.compile(r"[0-9,a-z,.,_]*.pdf"), r' ', ('pdf',)),
+    (re.compile(r"[0-9,a-z,.,_]*.doc"), r' ', ('doc',)),
+    #phone numbers
+    (re.compile(r"\d{3}(-|\s)\d{3}(-|\s)\d{4}"), r'  ', _DIGITS),
+]
+
+_CLEAN_RULES = [
+    #any directories showing up
+    (re.compile(r"(|\w*)\\[a-z,\\]*"), r' ', ('\\',)),
+    #removes all numeric strings or anything that is a mix of numbers and letters
+    (re.compile(r"\b(?=\w*\d)\w+"), r'  ', _DIGITS),
+    #assorted punctuation punctuation
+    (re.compile(r"""\[\^~\+=!-\*@#\$<>\.,;:\?!\|\-\(\)/"\'\[\]\{\}\\]"""), r'  ', ('[^~',)),
+    #finally any character which repeats >2 times
+    #will remove any extra whitespace for example
+    (re.compile(r'(.)\1{2,}\w+'), r' ', None),
+    (re.compile(r'\s+'), r' ', None),
+]
 
-    textstring = re.sub(r"\d{2}(:|\s)\d{2}\s(p|a)m", r' ', textstring)
+#the punctuation class used by ultraClean, which is replaced character by character
+_ULTRA_PUNCTUATION = re.compile('[\^~+=!-*@#$<>.,;:?!|\-\(\)/"\'\[\]]')
+_ULTRA_PUNCTUATION_CHARS = ''.join(c for c in map(chr, range(256)) if _ULTRA_PUNCTUATION.match(c))
+_ULTRA_PUNCTUATION_SPACES = string.maketrans(_ULTRA_PUNCTUATION_CHARS, ' '*len(_ULTRA_PUNCTUATION_CHARS))
 
-    #dates
+_ULTRA_RULES = [
+    (re.compile(r'(.)\1{2,}'), r' ', None),
+]
 
-    textstring = re.sub(r"\d{2}/\d{2}/\d{4}", r' ', textstring)
-    #attachment names
-    textstring = re.sub(r"[0-9,a-z,.,_]*.pdf",r' ',textstring)
-    textstring = re.sub(r"[0-9,a-z,.,_]*.doc",r' ',textstring)
+def _applyRules(textstring, rules):
 
-    textstring = re.sub(r"\d{3}(-|\s)\d{3}(-|\s)\d{4}", r'  ', textstring)
+    """Run the cleaning rules in order over textstring"""
 
-    #any directories showing up
+    for pattern, replacement, triggers in rules:
 
-    textstring = re.sub(r"(|\w*)\\[a-z,\\]*", r' ', textstring)
+        if triggers != None and not any(t in textstring for t in triggers):
+            continue
 
-    #removes all numeric strings or anything that is a mix of numbers and letters
+        textstring = pattern.sub(replacement, textstring)
+
+    return textstring
+
+def _startClean(textstring):
+
+    """Common start of the cleaning: lower case, strip characters and cut at the original message"""
+
+    textstring = textstring.lower()
+
+    #first remove all the \n and unicode remnants
+
+    textstring = stripCharacters(textstring)
+
+    #index of the first occurance of the search string. Want the 
+    #message from the beginning to that point
+
+    cut = textstring.find('Original Message')
+
+    if (cut != -1):
+        textstring = textstring[:cut]
+
+    return _applyRules(textstring, _EMAIL_RULES)
+
+def cleanString(textstring):
 
-    textstring = re.sub (r"\b(?=\w*\d)\w+", r'  ', textstring)
+    """Clean the text of an email for the text column"""
+
+    textstring = _startClean(textstring)
+
+    return _applyRules(textstring, _CLEAN_RULES)
+
+def ultraClean(textstring):
+
+    """The extra cleaning used by update_column.py. Same as cleanString up to the
+    phone numbers, then a wider punctuation strip and no whitespace collapsing"""
+
+    textstring = _startClean(textstring)
 
     #assorted punctuation punctuation
-    textstring = re.sub(r"""\[\^~\+=!-\*@#\$<>\.,;:\?!\|\-\(\)/"\'\[\]\{\}\\]""", r'  ' , textstring)
-    
+
+    if isinstance(textstring, unicode):
+        textstring = _ULTRA_PUNCTUATION.sub(r' ', textstring)
+    else:
+        textstring = textstring.translate(_ULTRA_PUNCTUATION_SPACES)
+
     #finally any character which repeats >2 times
     #will remove any extra whitespace for example
-    textstring = re.sub(r'(.)\1{2,}\w+', r' ', textstring)
 
-    textstring = re.sub(r'\s\s*', r' ', textstring)
+    return _applyRules(textstring, _ULTRA_RULES)
 
-    return textstring
+def normaliseAddress(address):
+
+    """Lower case and strip the quotes and spaces left around an email address"""
+
+    return address.strip().strip('"\'').strip().lower()
 
 def getCustomStopwords(filename='add_stopwords.txt'):
 
@@ -125,33 +190,97 @@ def queryDb(table, column, criteria):
     con.close()
     return results
 
+def streamTexts(column='text', start=0, stop=None, fetchsize=1000, table='emails'):
+
+    """Generator over (id, column) for the rows with start < id <= stop, in id order.
+    Rows are read fetchsize at a time with keyset pagination (where id > last id), so
+    each query is a range scan on the primary key and gaps in the ids are skipped"""
+
+    con, cur = connectDB("enron")
+
+    if stop == None:
+        query = "select id, {0} from {1} where id > %s order by id limit %s".format(column, table)
+    else:
+        query = "select id, {0} from {1} where id > %s and id <= {2:d} order by id limit %s".format(column, table, stop)
+
+    lastid = start
+
+    try:
+
+        while True:
+
+            cur.execute(query, (lastid, fetchsize))
+            rows = cur.fetchall()
+
+            if not rows:
+                break
+
+            for row in rows:
+                yield row
+
+            lastid = rows[-1][0]
+
+    finally:
+
+        con.close()
+
+def streamIds(ids, column='text', fetchsize=1000, table='emails'):
+
+    """Generator over (id, column) for the given ids, in the order given, fetching
+    fetchsize rows per query. Ids that are not in the table are skipped"""
+
+    con, cur = connectDB("enron")
+
+    ids = list(ids)
+
+    try:
+
+        for start in range(0, len(ids), fetchsize):
+
+            part = ids[start:start+fetchsize]
+            cur.execute("select id, {0} from {1} where id in ({2})".format(column, table,
+                ', '.join(['%s']*len(part))), part)
+            found = dict(cur.fetchall())
+
+            for id in part:
+                if id in found:
+                    yield (id, found[id])
+
+    finally:
+
+        con.close()
+
+def lastId(table='emails'):
+
+    """Highest id in the table"""
+
+    con, cur = connectDB("enron")
+    cur.execute("select id from {0} order by id desc limit 1;".format(table))
+    size = int(cur.fetchone()[0])
+    con.close()
+
+    return size
+
 def querySample(N, seed=False, return_sample = False):
-    con, cur=connectDB("enron")
 
-    cur.execute("select id from emails order by id desc limit 1;")
-    res = cur.fetchall()
-    size=[int(col) for row in res for col in row]
+    size = lastId()
 
     # We generate a random sample of the entries.
     if seed != False:
         random.seed(seed)
 
-    sample=random.sample(range(size[0]),int(math.floor(size[0]*N)))
-    print "{0}% sample ({1} emails) extracted at random".format(N*100.,int(math.floor(size[0]*N)))
-    texts=[]
+    sample=random.sample(range(1, size+1),int(math.floor(size*N)))
+    print "{0}% sample ({1} emails) extracted at random".format(N*100.,int(math.floor(size*N)))
 
-    # We query the emails in the sample and store them in a list
-    for id in sample:
-        cur.execute(" select text from emails where id = {0} ".format(id))
-        tmp=cur.fetchall()
-        texts.append(tmp[0][0])
-
-    con.close()
+    # We query the emails in the sample and store them in a list.
+    # Ids missing from the table are left out of both lists
+    found = list(streamIds(sample))
+    texts = [text for id, text in found]
 
     if not return_sample:
         return texts
     else:
-        return (texts, sample)
+        return (texts, [id for id, text in found])
 
 def deleteTable(cur, tablename):
         """Delete a table when you are connected to the database"""
@@ -163,8 +292,9 @@ def deleteDB(cur, dbname):
         cur.execute("""DROP DATABASE IF EXISTS {0}""".format(dbname))
         return
 
-def connectDB(db):
-	"""Connect to a database with the following credentials"""
-        connection = mdb.connect('localhost', 'kpmg1', 's2ds', db)
+def connectDB(db, **kwargs):
+	"""Connect to a database with the following credentials.
+        Extra keyword arguments are passed on to MySQLdb.connect"""
+        connection = mdb.connect('localhost', 'kpmg1', 's2ds', db, **kwargs)
         cursor=connection.cursor()
         return (connection,cursor)
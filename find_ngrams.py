@@ -6,14 +6,22 @@ a/two file/s with the results (bigrams.txt and/or trigrams.txt)
 
 Usage:
 python collocations --sample 0.5 --min_freq 1000 --max_ngrams 100 --word_len 3
+
+With --stream the whole emails table is read instead of a sample, in shards of --shard ids counted
+by --workers processes (see collocations.py), so memory does not grow with the number of emails:
+python find_ngrams.py --stream --min_freq 1000 --max_ngrams 100 --word_len 3 [--workers 4]
 """
 import logging
 
 import argparse
 import math
+import multiprocessing
 import random
+import time
 import MySQLdb as mdb
+import enron
 import specialwords as words
+import collocations
 
 #from ngrams import abb_dictionary
 
@@ -21,10 +29,87 @@ logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
 logging.root.level = logging.INFO  # ipython sometimes messes up the logging setup; restore
 
 parser = argparse.ArgumentParser(description="Generating a dictionary of stopwords")
-parser.add_argument("--sample",help="Size of sample in percentage", required=True,type=float)
+parser.add_argument("--sample",help="Size of sample in percentage", default=None,type=float)
 parser.add_argument("--min_freq",help="Minimal frequency of ocurrence to be considered",required=True,type=int)
 parser.add_argument("--max_ngrams",help="Maximal number of collocations to be found",required=True,type=int)
 parser.add_argument("--word_len",help="Minimal word length to be considered",required=True,type=int)
+parser.add_argument("--stream",help="Count the whole table in shards instead of a sample",default=False,action='store_true')
+parser.add_argument("--workers",help="Number of processes counting shards",default=None,type=int)
+parser.add_argument("--shard",help="Number of ids in each shard",default=10000,type=int)
+parser.add_argument("--prune",help="Drop n-grams seen fewer times than this in a shard",default=1,type=int)
+parser.add_argument("--max_size",help="Maximal number of n-grams kept in memory while merging",default=20000000,type=int)
+
+
+def countShard(shard):
+    """
+    Worker for the streaming mode: the n-gram counts of the emails with start < id <= stop.
+    The tokens of the emails follow each other as if their texts had been joined
+    """
+
+    start, stop, word_len, prune = shard
+
+    tokens = []
+    for id, text in enron.streamTexts(start=start, stop=stop):
+        if text != None:
+            tokens.extend(words.ngramTokens(text, word_len))
+
+    counts = collocations.NgramCounts().add(tokens)
+
+    if prune > 1:
+        counts.prune(prune)
+
+    return counts
+
+def streamNgrams(freq, n_col, min_len, workers=None, shardsize=10000, prune=1, max_size=20000000):
+    """
+    Counts the n-grams of the whole table in shards of shardsize ids, merged in id order, and
+    writes the best bigrams (PMI) and trigrams (chi-square) to bigrams.txt and trigrams.txt
+    """
+
+    size = enron.lastId()
+    shards = [(start, min(start+shardsize, size), min_len, prune) for start in range(0, size, shardsize)]
+
+    pool = multiprocessing.Pool(processes = workers)
+    counts = collocations.NgramCounts()
+    t0 = time.time()
+
+    try:
+
+        for i, shard in enumerate(pool.imap(countShard, shards)):
+
+            counts.merge(shard)
+
+            if counts.size() > max_size:
+                threshold = counts.bound(max_size/2)
+                logging.info("n-grams seen fewer than %i times dropped to stay under %i" % (threshold, max_size))
+
+            logging.info("Shard %i/%i merged: %i words, %i n-grams (%.0f sec)" %
+                         (i+1, len(shards), len(counts.words), counts.size(), time.time()-t0))
+
+        pool.close()
+
+    except:
+
+        pool.terminate()
+        raise
+
+    finally:
+
+        pool.join()
+
+    if counts.pruned > freq:
+        logging.warning("Counts were pruned at %i, above --min_freq %i: rare n-grams may be missing" %
+                        (counts.pruned, freq))
+
+    trigrams = [' '.join(w) for w in collocations.bestTrigrams(counts, n_col, freq)]
+    logging.info("%i trigrams found: %s..." % (len(trigrams), trigrams[:20]))
+
+    bigrams = [' '.join(w) for w in collocations.bestBigrams(counts, n_col, freq)]
+    logging.info("%i bigrams found: %s..." % (len(bigrams), bigrams[:20]))
+
+    words.writeNgrams(bigrams, trigrams)
+
+    return
 
 
 def main():
@@ -34,35 +119,34 @@ def main():
     n_col = args.max_ngrams
     min_len = args.word_len
 
+    if args.stream:
+        print ("Streaming the whole table in shards of {0} ids").format(args.shard)
+        print ("Minimum frequency: {0}").format(freq)
+        print ("Maximun number of collocations: {0}").format(n_col)
+        print ("Minimum word length: {0}").format(min_len)
+        streamNgrams(freq, n_col, min_len, args.workers, args.shard, args.prune, args.max_size)
+        return
+
+    if N == None:
+        parser.error("--sample is required unless --stream is given")
+
     print ("Sample Size: {0}*total").format(N)
     print ("Minimum frequency: {0}").format(freq)
     print ("Maximun number of collocations: {0}").format(n_col)
     print ("Minimum word length: {0}").format(min_len)
 
-    # Open the connection to the DB
-    connection = mdb.connect('localhost', 'kpmg1', 's2ds','enron')
-    cur=connection.cursor()
-
-
     # In our case the IDs are ordered by entry. Otherwise you could do:
     #  cur.execute("SELECT COUNT(*) FROM emails;")
     # The last ID number gives us the number of rows of the table.
-    cur.execute("select id from emails order by id desc limit 1;")
-    res = cur.fetchall()
-    size=[int(col) for row in res for col in row]
+    size=enron.lastId()
 
 
     # We generate a random sample of the entries.
     #random.seed(123)
-    sample=random.sample(range(size[0]),int(math.floor(size[0]*N)))
-
-    texts=[]
+    sample=random.sample(range(1, size+1),int(math.floor(size*N)))
 
     # We query the emails in the sample and store them in a list
-    for id in sample:
-        cur.execute(" select text from emails where id = {0} ".format(id))
-        tmp=cur.fetchall()
-        texts.append(tmp[0][0])
+    texts=[text for id, text in enron.streamIds(sample)]
 
     # Join all the text into a string to be able to count the frequency of ocurrence
     raw=" ".join(texts)
@@ -70,9 +154,6 @@ def main():
     # Call a function written in specialwords
     words.ngramsFinder(raw,freq, n_col,min_len)
 
-    # Close all cursors
-    connection.close()
-
     return
 
 
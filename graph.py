@@ -0,0 +1,243 @@
+#!/usr/env/python
+
+"""Build the communication graph of the whole emails table in one pass.
+
+Every email adds one to the weight of the edge sender -> recipient for each address
+in its to and cc fields. Node ids are the person ids of addresses_all.txt written
+by links.indexLinks. The weighted adjacency matrix is a scipy CSR matrix saved to
+an .npz file, with degree, PageRank and ego-network queries on top.
+
+Usage:
+python graph.py --build [--start 2000-01-01] [--end 2001-12-31]
+python graph.py --pagerank 20
+python graph.py --ego phillip.allen@enron.com
+"""
+
+import argparse
+import time
+from array import array
+import numpy as np
+import scipy.sparse as sp
+import MySQLdb.cursors
+import enron
+import addressbook
+
+
+def streamHeaders(start=None, end=None, fetchsize=10000):
+
+    """Generator over (sender, to, cc) for the whole emails table. Uses a server side
+    cursor so the rows are streamed rather than loaded into memory"""
+
+    con, cur = enron.connectDB('enron')
+    cur = con.cursor(MySQLdb.cursors.SSCursor)
+
+    query = "select `sender`, `to`, `cc` from emails"
+    conditions = []
+    params = []
+
+    if start != None:
+        conditions.append("`date` >= %s")
+        params.append(start)
+
+    if end != None:
+        conditions.append("`date` <= %s")
+        params.append(end)
+
+    if conditions:
+        query += " where " + " and ".join(conditions)
+
+    try:
+
+        cur.execute(query, params or None)
+
+        while True:
+
+            rows = cur.fetchmany(fetchsize)
+
+            if not rows:
+                break
+
+            for row in rows:
+                yield row
+
+    finally:
+
+        cur.close()
+        con.close()
+
+def buildGraph(resolver, rows, size=None):
+
+    """Weighted adjacency matrix (CSR) from (sender, to, cc) rows.
+    A[i, j] is the number of emails from person i with person j in to or cc.
+    Addresses the resolver does not know are dropped"""
+
+    senders = array('i')
+    receivers = array('i')
+
+    count = 0
+    start = time.time()
+
+    for sender, to, cc in rows:
+
+        sender_id = resolver.resolve(sender)
+
+        count += 1
+
+        if count % 100000 == 0:
+            print '{0} emails read ({1:.0f} emails/sec)'.format(count, count/(time.time()-start))
+
+        if sender_id == None:
+            continue
+
+        for rec in (to or '').split(',')+(cc or '').split(','):
+
+            rec = rec.strip()
+
+            if not rec:
+                continue
+
+            rec_id = resolver.resolve(rec)
+
+            if rec_id != None:
+                senders.append(sender_id)
+                receivers.append(rec_id)
+
+    if size == None:
+        size = resolver.maxId()+1
+
+    senders = np.frombuffer(senders, dtype=np.int32) if len(senders) else np.zeros(0, dtype=np.int32)
+    receivers = np.frombuffer(receivers, dtype=np.int32) if len(receivers) else np.zeros(0, dtype=np.int32)
+
+    #duplicate (i, j) pairs are summed when converting to CSR, which gives the weights
+
+    matrix = sp.coo_matrix((np.ones(len(senders), dtype=np.float64), (senders, receivers)),
+        shape=(size, size)).tocsr()
+
+    return matrix
+
+def saveGraph(filename, matrix):
+
+    """Save a CSR matrix as an .npz with its data, indices, indptr and shape"""
+
+    np.savez(filename, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+        shape=np.array(matrix.shape))
+
+    return
+
+def loadGraph(filename):
+
+    arrays = np.load(filename)
+
+    return sp.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']))
+
+def degrees(matrix, weighted=True):
+
+    """Returns (out degree, in degree) arrays. Unweighted counts distinct correspondents"""
+
+    if weighted:
+        return np.asarray(matrix.sum(axis=1)).ravel(), np.asarray(matrix.sum(axis=0)).ravel()
+
+    return np.diff(matrix.indptr), np.bincount(matrix.indices, minlength=matrix.shape[1])
+
+def pagerank(matrix, alpha=0.85, tol=1e-8, maxiter=100):
+
+    """Weighted PageRank by power iteration. People who never send are treated as
+    linking to everyone"""
+
+    n = matrix.shape[0]
+
+    if n == 0:
+        return np.zeros(0)
+
+    outweight = np.asarray(matrix.sum(axis=1)).ravel()
+    dangling = outweight == 0
+
+    #row normalise so each row is the probability of moving to each recipient
+
+    scale = np.zeros(n)
+    scale[~dangling] = 1.0/outweight[~dangling]
+    transition = sp.diags(scale, 0).dot(matrix).tocsr()
+    transposed = transition.T.tocsr()
+
+    rank = np.ones(n)/n
+
+    for i in range(maxiter):
+
+        previous = rank
+        rank = alpha*(transposed.dot(rank) + rank[dangling].sum()/n) + (1.0-alpha)/n
+
+        if np.abs(rank-previous).sum() < tol:
+            break
+
+    return rank
+
+def egoNetwork(matrix, node, undirected=True):
+
+    """Returns (node ids, sub matrix) for node and everyone it sent to or received from"""
+
+    neighbours = matrix.indices[matrix.indptr[node]:matrix.indptr[node+1]]
+
+    if undirected:
+        column = matrix.getcol(node).tocoo()
+        neighbours = np.union1d(neighbours, column.row)
+
+    nodes = np.union1d(neighbours, [node])
+
+    return nodes, matrix[nodes][:, nodes]
+
+parser = argparse.ArgumentParser(description='Communication graph of the whole emails table')
+parser.add_argument("--build", help="Stream the emails table and build the graph", default=False, action='store_true')
+parser.add_argument("--graph", help="Name of the .npz graph file", default='email_graph.npz', type=str)
+parser.add_argument("--addresses", help="Address index written by links.indexLinks", default='addresses_all.txt', type=str)
+parser.add_argument("--start", help="Only emails on or after this date (YYYY-MM-DD)", default=None, type=str)
+parser.add_argument("--end", help="Only emails on or before this date (YYYY-MM-DD)", default=None, type=str)
+parser.add_argument("--pagerank", help="Print the top N people by PageRank", default=0, type=int)
+parser.add_argument("--ego", help="Write the ego network of this address to ego_links.txt", default=None, type=str)
+
+def main():
+
+    args = parser.parse_args()
+
+    resolver = addressbook.loadResolver(args.addresses)
+
+    if args.build:
+
+        t0 = time.time()
+        matrix = buildGraph(resolver, streamHeaders(args.start, args.end))
+        saveGraph(args.graph, matrix)
+        print 'Graph with {0} people and {1} edges built in {2:.1f} sec'.format(matrix.shape[0], matrix.nnz, time.time()-t0)
+
+    else:
+
+        matrix = loadGraph(args.graph)
+
+    names = dict((person_id, address) for address, person_id in zip(resolver.sorted_addresses, resolver.sorted_ids))
+
+    if args.pagerank:
+
+        rank = pagerank(matrix)
+        outdeg, indeg = degrees(matrix)
+
+        for node in np.argsort(-rank)[:args.pagerank]:
+            print '{0}\t{1:.6f}\t{2:.0f}\t{3:.0f}\t{4}'.format(node, rank[node], outdeg[node], indeg[node], names.get(node, ''))
+
+    if args.ego != None:
+
+        node = resolver.resolve(args.ego)
+
+        if node == None:
+            print 'Nothing found for {0}'.format(args.ego)
+            return
+
+        nodes, sub = egoNetwork(matrix, node)
+        sub = sub.tocoo()
+
+        with open('ego_links.txt', 'w') as outfile:
+            for i, j, w in zip(sub.row, sub.col, sub.data):
+                outfile.write('{0}\t{1}\t{2:.0f}\n'.format(nodes[i], nodes[j], w))
+
+        print 'Ego network of {0}: {1} people, {2} edges'.format(args.ego, len(nodes), sub.nnz)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@
 """Extract links from MySQL database and dump into CSV file"""
 
 import enron
+import recipients
+import addressbook
 import csv, argparse
 import numpy as np
 
@@ -89,6 +91,8 @@ def sendersAndReceivers(sender):
 
 def matchEmail(email, address_list):
 
+    """Linear scan for the first address containing email. main uses
+    addressbook.AddressResolver instead, which does not scan the list"""
 
     indices = [i for i, s in enumerate(address_list['email_address']) if email in s]
 
@@ -108,6 +112,8 @@ def matchEmail(email, address_list):
 
 parser = argparse.ArgumentParser(description='Extracts links from MySQL database and produces CSV file')
 parser.add_argument("--person","-p",help="Person of interest", required=True, type=str)
+parser.add_argument("--indexed","-i",help="Look the person up in the email_recipients table (fill it with recipients.py). "
+                    "Matches the start of addresses only", default=False, action='store_true')
 
 #
 
@@ -117,11 +123,15 @@ def main():
 
     poi = args.person
 
-    addresses = np.genfromtxt('addresses_all.txt', unpack = True, dtype=[('person_id','i8'), ('email_address', 'S400')], 
-        delimiter='\t')
+    #built once from addresses_all.txt and cached in addresses_all.pkl
 
+    resolver = addressbook.loadResolver('addresses_all.txt')
 
-    datarows = sendersAndReceivers(args.person)
+
+    if args.indexed:
+        datarows = recipients.personEmails(args.person)
+    else:
+        datarows = sendersAndReceivers(args.person)
 
     print 'Sorting through data received'
 
@@ -131,15 +141,15 @@ def main():
 
     for sender,to,cc,id in datarows:
 
-        recipients = [x.strip() for x in to.split(',')+cc.split(',')]
+        rec_list = [x.strip() for x in to.split(',')+cc.split(',')]
 
         if (poi in sender):
 
-            sender_id = matchEmail(sender, addresses)
+            sender_id = resolver.resolve(sender)
 
-            for rec in recipients:
+            for rec in rec_list:
 
-                rec_id = matchEmail(rec,addresses)
+                rec_id = resolver.resolve(rec)
 
                 outfile.write('{0}\t{1}\n'.format(sender_id, rec_id))
 
@@ -147,10 +157,10 @@ def main():
 
             #get sender id
 
-            sender_id = matchEmail(sender, addresses)
+            sender_id = resolver.resolve(sender)
 
-            person = recipients[[poi in x.lower() for x in recipients].index(True)]
-            rec_id = matchEmail(person, addresses)
+            person = rec_list[[poi in x.lower() for x in rec_list].index(True)]
+            rec_id = resolver.resolve(person)
 
             outfile.write('{0}\t{1}\n'.format(sender_id, rec_id))
 
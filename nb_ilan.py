@@ -5,6 +5,7 @@
 import enron
 import stemming as stem
 import cPickle as pickle
+import argparse
 
 
 def importTopics(filename):
@@ -46,39 +47,48 @@ def pofTgivenD(doc,topics):
 
 
 
+parser = argparse.ArgumentParser(description='Probability of each email given the LSI topics')
+parser.add_argument("--tokenstore", help="Keep the stemmed tokens in this directory (see tokenstore.py) and read them back on later runs. "
+                    "Off by default",
+                    default=None, type=str)
+
 def main():
 
+    args = parser.parse_args()
+
     topics=importTopics('corpus_min1_stopwdsTrue_all_tfidf_lsi_topics.pkl')
     #topics=importTopics('test_corpus_lsi_topics.pkl')
     #print topics[0][0]
 
-    con, cur=enron.connectDB("enron")
-
-    cur.execute("select id from emails order by id desc limit 1;")
-    res = cur.fetchall()
-    tmp = [int(col) for row in res for col in row]
-    size=tmp[0]
+    size=enron.lastId()
 
     #pofD=1./float(size)
     #pofT=1./10.
 
+    texts_id=((id, enron.cleanString(enron.stripCharacters(text))) for id, text in enron.streamTexts(stop=size-1))
+
+    # With --tokenstore the stemmed tokens are read from the store when an earlier run already did them
+    if args.tokenstore != None:
+        store=stem.tokenStore(args.tokenstore, stopwords=True)
+        texts_stem=stem.stemmingStored(texts_id, store, stopwords=True)
+    else:
+        texts_stem=((id, stem.stemmingString(text, id, stopwords=True)) for id, text in texts_id)
+
     tot=0
-    for id in range(1,size):
-        cur.execute(" select text from emails where id = {0} ".format(id))
-        tmp = cur.fetchall()
-        text = enron.cleanString(enron.stripCharacters(tmp[0][0]))
-        text_stem = stem.stemmingString(text, id, stopwords=True)
+    for id, text_stem in texts_stem:
         #topicprob=pofTgivenD(text_stem,topics)*pofD/pofT 
         topicprob=pofTgivenD(text_stem,topics)     
         tot+=topicprob
         if topicprob>1.: print "ERROR: PROBABILITY LARGER THAN 1",id, topicprob
         if id % 1000 == 0: print "Email {0} processed, probability sum: {1}".format(id,tot)
         #print "Probability of generating email {0} from this topic set: {1}".format(id,topicprob)
-    con.close()
 
 
     print "Final sum of probabilities:",tot
 
+    if args.tokenstore != None:
+        store.close()
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,144 @@
+"""
+Multi-pattern phrase matching with an Aho-Corasick automaton.
+
+PhraseMatcher(phrases) builds the automaton once. finditer(text) then reports every
+occurrence of every phrase in a single pass over the text, so the cost per text
+depends on its length and not on the number of phrases.
+
+replace(text, replacements) replaces the matches the same way as calling re.sub for
+each phrase in turn, in list order: an earlier phrase wins when two matches overlap.
+"""
+
+import bisect
+from collections import deque
+
+
+class PhraseMatcher(object):
+
+    def __init__(self, phrases, boundaries=False):
+
+        """
+        :param phrases: list of strings to look for. Empty strings are ignored
+        :param boundaries: only report matches that start and end on a word boundary
+        """
+
+        self.phrases = list(phrases)
+        self.lengths = [len(p) for p in self.phrases]
+        self.boundaries = boundaries
+
+        # goto[node] maps a character to the next node, out[node] lists the phrases ending there
+        goto = [{}]
+        out = [[]]
+
+        for index, phrase in enumerate(self.phrases):
+            if not phrase:
+                continue
+            node = 0
+            for ch in phrase:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                node = nxt
+            out[node].append(index)
+
+        # Failure links, breadth first so that the links of shorter prefixes are ready first
+        fail = [0]*len(goto)
+        queue = deque(goto[0].values())
+
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].iteritems():
+                queue.append(child)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0)
+                out[child] = out[child] + out[fail[child]]
+
+        self.goto = goto
+        self.fail = fail
+        self.out = out
+
+    def finditer(self, text):
+
+        """
+        Yields (start, end, index) for every occurrence of every phrase in text,
+        overlapping ones included, in order of their end position
+        """
+
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        lengths = self.lengths
+        node = 0
+
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                end = i + 1
+                for index in out[node]:
+                    start = end - lengths[index]
+                    if self.boundaries and not self.atBoundaries(text, start, end):
+                        continue
+                    yield (start, end, index)
+
+    def atBoundaries(self, text, start, end):
+
+        """True if text[start:end] is not glued to a word character on either side"""
+
+        if start > 0 and (text[start-1].isalnum() or text[start-1] == '_'):
+            return False
+        if end < len(text) and (text[end].isalnum() or text[end] == '_'):
+            return False
+        return True
+
+    def select(self, text):
+
+        """
+        Returns the non-overlapping matches (start, end, index) that replacing the phrases
+        one after the other, in list order and left to right, would use. Sorted by start.
+        """
+
+        matches = sorted(self.finditer(text), key=lambda m: (m[2], m[0]))
+
+        starts = []
+        chosen = []
+
+        for start, end, index in matches:
+            i = bisect.bisect_right(starts, start)
+            # overlaps the chosen match starting before it, or the one starting after it
+            if i > 0 and chosen[i-1][1] > start:
+                continue
+            if i < len(starts) and starts[i] < end:
+                continue
+            starts.insert(i, start)
+            chosen.insert(i, (start, end, index))
+
+        return chosen
+
+    def replace(self, text, replacements):
+
+        """
+        Replace the selected matches of phrase i by replacements[i].
+        Returns the new text and the sorted list of phrase indices that were replaced.
+        """
+
+        chosen = self.select(text)
+
+        if not chosen:
+            return text, []
+
+        pieces = []
+        last = 0
+        for start, end, index in chosen:
+            pieces.append(text[last:start])
+            pieces.append(replacements[index])
+            last = end
+        pieces.append(text[last:])
+
+        return ''.join(pieces), sorted(set(index for start, end, index in chosen))
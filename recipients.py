@@ -0,0 +1,159 @@
+#!/usr/env/python
+
+"""Fill the addresses and email_recipients tables from the sender, to, cc and bcc
+columns of the emails table, so looking people up is an index lookup instead of a
+LIKE '%name%' scan over the longtext columns.
+
+Usage:
+python recipients.py [--resume-from ID] [--chunk 1000]
+
+By default it carries on from the highest email id already in email_recipients,
+so it can be run again after every createdb.py ingest.
+"""
+
+import argparse
+import time
+import enron
+import createdb
+
+
+ROLES = ('from', 'to', 'cc', 'bcc')
+
+def localPart(address):
+
+    """Everything before the @, or the whole address for the internal Name/HOU/ECT style"""
+
+    return address.split('@')[0]
+
+def splitAddresses(field):
+
+    """List of normalised addresses in a comma separated header field"""
+
+    if field == None:
+        return []
+
+    addresses = [enron.normaliseAddress(a) for a in field.split(',')]
+
+    #the unique index is on varchar(255) so anything longer is a parsing relic anyway
+
+    return [a for a in addresses if a and len(a) <= 255]
+
+def addressIds(cursor, addresses, cache):
+
+    """Returns the ids of addresses, adding the ones not in the table yet.
+    cache is a dict of address: id which is updated in place"""
+
+    missing = list(set(a for a in addresses if a not in cache))
+
+    if missing:
+
+        cursor.executemany("INSERT IGNORE INTO `addresses` (`address`, `local_part`) VALUES (%s, %s)",
+            [(a, localPart(a)) for a in missing])
+
+        for start in range(0, len(missing), 1000):
+
+            part = missing[start:start+1000]
+            cursor.execute("SELECT `address`, `id` FROM `addresses` WHERE `address` IN ({0})".format(
+                ', '.join(['%s']*len(part))), part)
+            cache.update(cursor.fetchall())
+
+    return [cache[a] for a in addresses]
+
+def backfillRecipients(connection, cursor, chunk=1000, resume_from=0):
+
+    """Fill email_recipients for every email with an id greater than resume_from,
+    reading the emails table in id order a chunk at a time. Returns the number of emails done"""
+
+    select = "SELECT `id`, `sender`, `to`, `cc`, `bcc` FROM `emails` WHERE `id` > %s ORDER BY `id` LIMIT %s"
+    insert = "INSERT IGNORE INTO `email_recipients` (`email_id`, `address_id`, `role`) VALUES (%s, %s, %s)"
+
+    cache = {}
+    lastid = resume_from
+    done = 0
+    start = time.time()
+
+    while True:
+
+        cursor.execute(select, (lastid, chunk))
+        rows = cursor.fetchall()
+
+        if not rows:
+            break
+
+        links = []
+
+        for row in rows:
+
+            for role, field in zip(ROLES, row[1:]):
+
+                for address in splitAddresses(field):
+
+                    links.append((row[0], address, role))
+
+        ids = addressIds(cursor, [address for email_id, address, role in links], cache)
+
+        cursor.executemany(insert, [(email_id, address_id, role) for (email_id, address, role), address_id
+            in zip(links, ids)])
+        connection.commit()
+
+        lastid = rows[-1][0]
+        done += len(rows)
+
+        print 'Recipients added up to id {0} ({1:.1f} emails/sec)'.format(lastid, done/(time.time()-start))
+
+    return done
+
+def personEmails(person, limit=1000):
+
+    """Emails sent to or from anyone whose address starts with person, which covers
+    every address whose local part does. Returns rows of (sender, to, cc, id) like
+    links.sendersAndReceivers. Only prefixes can use the index, so a surname will not
+    match firstname.surname@enron.com"""
+
+    con, cur = enron.connectDB('enron')
+
+    pattern = enron.normaliseAddress(person)+'%'
+
+    query = """SELECT DISTINCT e.`sender`, e.`to`, e.`cc`, e.`id` FROM `addresses` a
+        JOIN `email_recipients` r ON r.`address_id` = a.`id`
+        JOIN `emails` e ON e.`id` = r.`email_id`
+        WHERE a.`address` LIKE %s AND r.`role` IN ('from', 'to', 'cc')
+        LIMIT %s"""
+
+    cur.execute(query, (pattern, limit))
+    rows = cur.fetchall()
+    con.close()
+
+    return rows
+
+parser = argparse.ArgumentParser(description="Fill the addresses and email_recipients tables")
+parser.add_argument("-r", "--resume-from", help="Only process emails with an id greater than this. "
+                    "Defaults to the last email already processed", default=None, type=int, dest='resume_from')
+parser.add_argument("--chunk", help="Number of emails read at a time", default=1000, type=int)
+
+def main():
+
+    args = parser.parse_args()
+
+    connection, cursor = enron.connectDB('enron')
+
+    createdb.createMissingTables(cursor)
+
+    resume_from = args.resume_from
+
+    if resume_from == None:
+
+        cursor.execute("SELECT MAX(`email_id`) FROM `email_recipients`")
+        resume_from = cursor.fetchone()[0] or 0
+
+    print 'Adding recipients for emails after id {0}'.format(resume_from)
+
+    done = backfillRecipients(connection, cursor, chunk=args.chunk, resume_from=resume_from)
+
+    connection.close()
+
+    print '{0} emails processed'.format(done)
+
+
+if __name__ == '__main__':
+    main()
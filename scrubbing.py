@@ -1,26 +1,68 @@
 from nltk.corpus import stopwords
 from nltk.tokenize import WordPunctTokenizer
-from nltk.tokenize import PunktWordTokenizer
+try:
+    from nltk.tokenize import PunktWordTokenizer
+except ImportError:
+    # Removed from NLTK 3, "punktword" then uses PUNKTWORD_RE below
+    PunktWordTokenizer = None
 #from nltk.tokenize import RegexpTokenizer
 from nltk.stem.snowball import EnglishStemmer
 from nltk.stem.snowball import PorterStemmer
 from nltk.stem.lancaster import LancasterStemmer
 from nltk.stem import WordNetLemmatizer
+import re
+import stemcache
 
 
 # Put the NLTK compendium of stop words into a set
 english_stops = set(stopwords.words('english'))
 
 
+# The pattern PunktWordTokenizer uses (PunktLanguageVars.word_tokenize in NLTK 2), compiled once.
+# findall with it gives exactly the tokens of PunktWordTokenizer().tokenize
+_re_word_start = r"[^\(\"\`{\[:;&\#\*@\)}\]\-,]"
+_re_non_word_chars = r"(?:[?!)\";}\]\*:@\'\({\[])"
+_re_multi_char_punct = r"(?:\-{2,}|\.{2,}|(?:\.\s){2,}\.)"
+
+PUNKTWORD_RE = re.compile(r'''(
+    %(MultiChar)s
+    |
+    (?=%(WordStart)s)\S+?  # Accept word characters until end is found
+    (?= # Sequences marking a word's end
+        \s|                                 # White-space
+        $|                                  # End-of-string
+        %(NonWord)s|%(MultiChar)s|          # Punctuation
+        ,(?=$|\s|%(NonWord)s|%(MultiChar)s) # Comma if at end of word
+    )
+    |
+    \S
+)''' % {'NonWord': _re_non_word_chars,
+         'MultiChar': _re_multi_char_punct,
+         'WordStart': _re_word_start}, re.UNICODE | re.VERBOSE)
+
+# The pattern of WordPunctTokenizer
+WORDPUNCT_RE = re.compile(r'\w+|[^\w\s]+', re.UNICODE | re.MULTILINE | re.DOTALL)
+
+# Tokenizers are built once and shared, by name.
+# "regex" and "regexwordpunct" are the precompiled patterns above, and give the same tokens
+# as "punktword" and "wordpunct" without going through NLTK
+_tokenizers = {'regex': PUNKTWORD_RE.findall, 'regexwordpunct': WORDPUNCT_RE.findall}
+
+def getTokenizer(tokenizer="wordpunct"):
+    if tokenizer not in _tokenizers:
+        if tokenizer=="wordpunct":
+            _tokenizers[tokenizer]=WordPunctTokenizer().tokenize
+        if tokenizer=="punktword":
+            if PunktWordTokenizer == None:
+                _tokenizers[tokenizer]=PUNKTWORD_RE.findall
+            else:
+                _tokenizers[tokenizer]=PunktWordTokenizer().tokenize
+    return _tokenizers[tokenizer]
+
 def tokenizeString(string,lower=True,tokenizer="wordpunct"):
-    if tokenizer=="wordpunct":
-        tokenized=WordPunctTokenizer().tokenize(string)
-        if lower==True:
-            tokenized=[w.lower() for w in tokenized]
-    if tokenizer=="punktword":
-        tokenized=PunktWordTokenizer().tokenize(string)
-        if lower==True:
-            tokenized=[w.lower() for w in tokenized]
+    tokenized=getTokenizer(tokenizer)(string)
+    if lower==True:
+        tokenized=[w.lower() for w in tokenized]
     return tokenized
 
 def cleanVector(tokens,clean=True,stopremove=True,minlen=2):
@@ -42,28 +84,10 @@ def cleanVector(tokens,clean=True,stopremove=True,minlen=2):
     return output
 
 def stemVector(vector,method="lemmatize"):
-    output=[]
-    if method=='lemmatize':
-        wnl = WordNetLemmatizer()
-        for i in vector:
-            i=wnl.lemmatize(i)
-            output.append(i)
-    if method=='snowball':
-        st=EnglishStemmer()
-        for i in vector:
-            i=st.stem(i)
-            output.append(i)
-    if method=='porter':
-        st=PorterStemmer()
-        for i in vector:
-            i=st.stem(i)
-            output.append(i)
-    if method=='lancaster':
-        st=LancasterStemmer()
-        for i in vector:
-            i=st.stem(i)
-            output.append(i)
-    return output
+    # The stemmers are shared and memoised, see stemcache.py
+    if method in ('lemmatize','snowball','porter','lancaster'):
+        return stemcache.getStemmer(method).stemList(vector)
+    return []
 
 
 # Warning: Punktword tokenization does not separate full stops from words, which with this current implementation results in the entire word being dropped when the full stop is found. Use 'wordpunct' as default.
@@ -0,0 +1,180 @@
+#!/usr/env/python
+
+"""Fixed memory summaries of token streams.
+
+HyperLogLog estimates the number of distinct tokens in 2**p bytes, with a
+relative error of about 1.04/sqrt(2**p) (0.8% for the default p=14).
+
+SpaceSaving keeps k counters and finds the heavy hitters: every token that
+occurs more than total/k times is guaranteed to be kept. Its counter is at most
+its true count plus the error stored with it, and the counts reported are the
+counter minus the error, which never exceed the true count.
+
+Both can be merged, so several processes can each summarise part of the data.
+"""
+
+import hashlib
+import heapq
+import math
+import struct
+
+
+_UINT64 = struct.Struct('>Q')
+
+def hash64(item):
+
+    """64 bit hash of a string that is the same in every process and every run"""
+
+    if isinstance(item, unicode):
+        item = item.encode('utf-8')
+
+    return _UINT64.unpack(hashlib.md5(item).digest()[:8])[0]
+
+class HyperLogLog(object):
+
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, item):
+
+        h = hash64(item)
+        index = h >> (64 - self.p)
+
+        # position of the first 1 bit in the remaining 64-p bits
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+        return
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def merge(self, other):
+
+        if other.p != self.p:
+            raise ValueError("Can only merge HyperLogLogs with the same precision")
+
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+        return self
+
+    def count(self):
+
+        """Estimated number of distinct items added"""
+
+        m = self.m
+
+        if m >= 128:
+            alpha = 0.7213/(1 + 1.079/m)
+        elif m == 64:
+            alpha = 0.709
+        elif m == 32:
+            alpha = 0.697
+        else:
+            alpha = 0.673
+
+        estimate = alpha*m*m/sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count('\x00')
+
+        # small range correction: linear counting
+        if estimate <= 2.5*m and zeros > 0:
+            return int(round(m*math.log(float(m)/zeros)))
+
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+class SpaceSaving(object):
+
+    def __init__(self, k=10000):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self.heap = []
+        self.total = 0
+
+    def add(self, item, weight=1):
+
+        """Count item weight times"""
+
+        counts = self.counts
+        self.total += weight
+
+        if item in counts:
+            counts[item] += weight
+            heapq.heappush(self.heap, (counts[item], item))
+        elif len(counts) < self.k:
+            counts[item] = weight
+            self.errors[item] = 0
+            heapq.heappush(self.heap, (weight, item))
+        else:
+            # replace the item with the smallest count, which becomes the error of the new one
+            smallest, victim = self.popMin()
+            del counts[victim]
+            del self.errors[victim]
+            counts[item] = smallest + weight
+            self.errors[item] = smallest
+            heapq.heappush(self.heap, (counts[item], item))
+
+        # the heap keeps stale entries for items whose count went up, clear them now and then
+        if len(self.heap) > 4*self.k:
+            self.heap = [(count, item) for item, count in counts.iteritems()]
+            heapq.heapify(self.heap)
+
+        return
+
+    def popMin(self):
+
+        while True:
+            count, item = heapq.heappop(self.heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def update(self, counter):
+
+        """Add a dict or Counter of item -> count"""
+
+        for item, count in counter.iteritems():
+            self.add(item, count)
+
+    def merge(self, other):
+
+        """Add the counters of another SpaceSaving. The result is still a valid summary,
+        with the errors of both added"""
+
+        for item, count in other.counts.iteritems():
+            error = other.errors[item]
+            self.add(item, count)
+            self.errors[item] = self.errors.get(item, 0) + error
+
+        return self
+
+    def guaranteed(self):
+
+        """(item, count - error) for every item kept: the number of times it was
+        certainly seen. For the heavy hitters this is usually the exact count"""
+
+        errors = self.errors
+
+        return [(item, count - errors[item]) for item, count in self.counts.iteritems()]
+
+    def most_common(self, n=None):
+
+        """[(item, guaranteed count)] from the most frequent, like Counter.most_common"""
+
+        items = sorted(self.guaranteed(), key=lambda x: (-x[1], x[0]))
+
+        return items if n == None else items[:n]
+
+    def over(self, threshold):
+
+        """{item: guaranteed count} for every item certainly seen at least threshold times"""
+
+        return dict((item, count) for item, count in self.guaranteed() if count >= threshold)
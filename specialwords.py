@@ -15,6 +15,7 @@ Computes best ngrams from an input text
 ngramsText(text,n,file1,file2=None) -->
 Returns a text where the ngrams read from
 an external file are joined as a single token.
+NgramJoiner does the same with the files read once, for repeated calls.
 n=2 considers only bigrams given in file1
 n=3 considers bigrams and trigrams given in file1 and file2 respectively
 Returns the text and a file with all the occurrences
@@ -27,6 +28,8 @@ import logging
 import re
 import os
 import csv
+import phrasematcher
+import auditlog
 from nltk.collocations import TrigramCollocationFinder
 from nltk.metrics import BigramAssocMeasures, TrigramAssocMeasures
 
@@ -36,85 +39,143 @@ from gensim.parsing.preprocessing import STOPWORDS
 logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
 logging.root.level = logging.INFO  # ipython sometimes messes up the logging setup; restore
 
+# Phrase matchers already built, by dictionary file name
+_abbreviation_matchers = {}
+
+def abbreviationMatcher(fname):
+
+    """
+    Loads the abbreviation dictionary fname (abbreviation;phrase per line) the first time
+    it is needed and returns (matcher, abbreviations, phrases) with everything lower case.
+    """
+
+    if fname not in _abbreviation_matchers:
+        with open(fname, 'Ur') as inputfile:
+            dic = [tuple(rec) for rec in csv.reader(inputfile, delimiter=';') if len(rec) >= 2]
+        abbs = [entry[0].lower() for entry in dic]
+        phrases = [entry[1].lower() for entry in dic]
+        _abbreviation_matchers[fname] = (phrasematcher.PhraseMatcher(phrases), abbs, phrases)
+
+    return _abbreviation_matchers[fname]
+
 def abbreviations(text,fname,id=None):
 
     """
     This function looks for phrases given in a dictionary (file) and replace them by their abbreviations
     in text.
-    It returns the modified text and an output file with all the ocurrences
+    It returns the modified text and an output file with all the ocurrences (written through auditlog,
+    use auditlog.setEnabled(False) to turn it off)
     You need to remove the file called "word_replace_dic.txt" otherwise it will append the results to the old file
     os.remove("word_replace_dic.txt")
 
+    The dictionary is loaded once and all the phrases are found in a single pass over the text.
+    When two phrases overlap the one listed first in the dictionary wins.
+    The text is returned in lower case if anything was replaced.
+
     """
 
-    # Open and read input file
-    with open(fname, 'Ur') as inputfile:
-        dic = list(tuple(rec) for rec in csv.reader(inputfile, delimiter=';'))
-    #Open output file
-    outfile = open('word_replace_dic.csv', 'a+')
+    matcher, abbs, phrases = abbreviationMatcher(fname)
 
-    for i in range(len(dic)):
-        if dic[i][1].lower() in text.lower():
-            text=re.sub(dic[i][1].lower(),dic[i][0].lower(), text.lower())
-            outfile.writelines("{0} ; {1} ; {2}\n".format(id,dic[i][0].lower(),dic[i][1].lower()))
-    outfile.close()
+    lowertext = text.lower()
+    newtext, found = matcher.replace(lowertext, abbs)
 
-    return text
+    if not found:
+        return text
 
+    auditlog.write('word_replace_dic.csv', ["{0} ; {1} ; {2}\n".format(id,abbs[i],phrases[i]) for i in found])
 
-def ngramsText(text,N,file1,file2,id=None):
-    """
-    This function takes a raw text and joins the trigrams and/or bigrams stored in file1(bigrams)
-    and file2(trigrams) using underscores. In this way the tokenizer will consider them a single token.
-    The argument n controls if only bigrams are to be found or also trigrams are expected.
-    It returns the processed text.
-    Remove the file "ngrams_found.csv"
+    return newtext
+
+
+class NgramJoiner(object):
 
     """
-    #Open output file
-    outfile = open('ngrams_found.csv', 'a+')
+    Joins the trigrams and/or bigrams stored in file1 (bigrams) and file2 (trigrams) with underscores
+    so the tokenizer considers them a single token. The files are read once and all the n-grams are
+    compiled into one phrase matcher, so join() finds them all in a single pass over the text.
+    Only whole words are joined, and trigrams are joined before any bigram they overlap with.
+    The object only holds lists and dicts, so it can be pickled and sent to worker processes.
+    """
+
+    def __init__(self, N, file1, file2=None):
+
+        self.N = N
+        ngrams = []
+
+        if N == 3:
+            ngrams += self.readNgrams(file2)
+        if N == 2 or N == 3:
+            ngrams += self.readNgrams(file1)
+
+        self.ngrams = ngrams
+        self.joined = [item.replace(' ','_') for item in ngrams]
+        self.matcher = phrasematcher.PhraseMatcher(ngrams, boundaries=True)
+
+    def readNgrams(self, fname):
 
-    if N == 3:
+        with open(fname) as f1:
+            ngrams = [str(t.strip('\n')).lower() for t in f1.readlines()]
 
-        #print "Reading trigrams..."
-        with open(file2) as f1:
-            trigrams = f1.readlines()
-            trigrams=[t.strip('\n') for t in trigrams]
-            f1.closed
+        return [t for t in ngrams if t]
 
-        for item in trigrams:
-            itemst=str(item).lower()
-            if itemst in text.lower():
-                text=re.sub(itemst,itemst.replace(' ','_'), text.lower())
-                outfile.writelines("{0} ; {1} \n".format(id,itemst))
+    def join(self, text, id=None):
 
-    if N == 2 or N == 3:
+        """
+        Returns the text in lower case with the n-grams joined, and writes each n-gram found to
+        ngrams_found.csv. The text is returned unchanged if nothing was found.
+        """
 
-        #print "Reading bigrams..."
-        with open(file1) as f1:
-            bigrams = f1.readlines()
-            bigrams=[b.strip('\n') for b in bigrams]
-            f1.closed
+        newtext, found = self.matcher.replace(text.lower(), self.joined)
 
-        for item in bigrams:
-            itemst=str(item).lower()
-            if N == 3:
-                if itemst in text.lower():
-                    text=re.sub(itemst,itemst.replace(' ','_'), text.lower())
-                    outfile.writelines("{0} ; {1} \n".format(id,itemst))
+        if not found:
+            return text
 
-            elif N == 2:
-                if itemst in text.lower():
-                    text=re.sub(itemst,itemst.replace(' ','_'), text.lower())
-                    outfile.writelines("{0} ; {1} \n".format(id,itemst))
+        auditlog.write('ngrams_found.csv', ["{0} ; {1} \n".format(id,self.ngrams[i]) for i in found])
 
+        return newtext
 
-    else:
+# NgramJoiner objects already built, by (N, file1, file2)
+_ngram_joiners = {}
+
+def ngramJoiner(N, file1, file2=None):
+
+    """Returns the NgramJoiner for these files, building it the first time it is needed"""
+
+    key = (N, file1, file2)
+    if key not in _ngram_joiners:
+        _ngram_joiners[key] = NgramJoiner(N, file1, file2)
+
+    return _ngram_joiners[key]
+
+def ngramsText(text,N,file1,file2,id=None):
+    """
+    This function takes a raw text and joins the trigrams and/or bigrams stored in file1(bigrams)
+    and file2(trigrams) using underscores. In this way the tokenizer will consider them a single token.
+    The argument n controls if only bigrams are to be found or also trigrams are expected.
+    It returns the processed text.
+    Remove the file "ngrams_found.csv"
+
+    """
+
+    if N != 2 and N != 3:
         print "Please insert the correct argument:\n 2 for bigrams \n 3 for bigrams and trigrams\n"
+        return text
 
-    outfile.close()
+    return ngramJoiner(N, file1, file2).join(text, id)
 
-    return text
+# Additional stopwords found in the results
+NGRAM_STOPWORDS=frozenset(['http','https','www','com','href','nbsp','arial','helvetica',
+                   'font','verdana','sans','serif','fri','sat','font','bgcolor','ffffff',
+                   'tel','fax','aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'])
+
+def ngramTokens(text,word_len):
+    """
+    The tokens the n-gram search works on: the text is tokenized eliminating non alphanumeric characters,
+    stopwords and also words of length <= word_len
+    """
+
+    return [word for word in gensim.utils.tokenize(text, lower=True)
+                if word not in STOPWORDS and len(word) > word_len if word not in NGRAM_STOPWORDS]
 
 def ngramsFinder(text,min_freq,num_col,word_len):
     """
@@ -125,14 +186,7 @@ def ngramsFinder(text,min_freq,num_col,word_len):
 
     """
 
-    # Additional stopwords found in the results
-    add_stopwords=['http','https','www','com','href','nbsp','arial','helvetica',
-                   'font','verdana','sans','serif','fri','sat','font','bgcolor','ffffff',
-                   'tel','fax','aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa']
-
-    # Tokenize the text eliminating non alphanumeric characters, stopwords and also words of length <= 3
-    tokens=[word for word in gensim.utils.tokenize(text, lower=True)
-                if word not in STOPWORDS and len(word) > word_len if word not in add_stopwords]
+    tokens=ngramTokens(text,word_len)
 
     # Find the collocations in our text based on the frequency they appear.
     # Here is where all the magic happens :-)
@@ -173,7 +227,19 @@ def best_ngrams(words, top_n, min_freq):
     bigrams = [' '.join(w) for w in bcf.nbest(BigramAssocMeasures.pmi, top_n)]
     logging.info("%i bigrams found: %s..." % (len(bigrams), bigrams[:20]))
 
-    # Write collocations to two files to be read by the preprocess program
+    writeNgrams(bigrams, trigrams)
+
+    pat_gram2 = re.compile('(%s)' % '|'.join(bigrams), re.UNICODE)
+    pat_gram3 = re.compile('(%s)' % '|'.join(trigrams), re.UNICODE)
+
+    return pat_gram2, pat_gram3
+
+def writeNgrams(bigrams, trigrams):
+
+    """
+    Write collocations (lists of space separated words) to two files to be read by the preprocess program
+    """
+
     f1 = open('bigrams.txt', 'w')
     f1.writelines(["{0}\n".format(item)  for item in bigrams])
     f1.close()
@@ -181,8 +247,3 @@ def best_ngrams(words, top_n, min_freq):
     f2 = open('trigrams.txt', 'w')
     f2.writelines(["{0}\n".format(item)  for item in trigrams])
     f2.close()
-
-    pat_gram2 = re.compile('(%s)' % '|'.join(bigrams), re.UNICODE)
-    pat_gram3 = re.compile('(%s)' % '|'.join(trigrams), re.UNICODE)
-
-    return pat_gram2, pat_gram3
@@ -0,0 +1,215 @@
+#!/usr/env/python
+
+"""Memoised stemming and lemmatisation.
+
+Email vocabulary is very skewed, so almost every call to a stemmer repeats an
+earlier one. CachedStemmer keeps token -> stem in a bounded least recently used
+cache in front of the NLTK stemmer. getStemmer(method) returns one shared
+CachedStemmer per method for the process, and saveCaches/loadCaches write them all
+to one pickle so the next run of create_dic.py or create_corpus.py starts warm.
+
+The methods are the ones scrubbing.stemVector exposes: lemmatize (WordNet),
+snowball, porter and lancaster.
+
+Worker processes fill their own copies of the caches. A worker calls trackNew()
+when it starts and sends takeNew() back with its results, and the parent adds
+them to its caches with mergeNew(), so saveCaches in the parent saves what the
+workers stemmed too.
+"""
+
+import os
+from collections import OrderedDict
+import cPickle as pickle
+
+
+def stemFunction(method):
+
+    """The uncached stem function for method"""
+
+    if method == 'lemmatize':
+        from nltk.stem import WordNetLemmatizer
+        return WordNetLemmatizer().lemmatize
+    if method == 'snowball':
+        from nltk.stem.snowball import EnglishStemmer
+        return EnglishStemmer().stem
+    if method == 'porter':
+        from nltk.stem.snowball import PorterStemmer
+        return PorterStemmer().stem
+    if method == 'lancaster':
+        from nltk.stem.lancaster import LancasterStemmer
+        return LancasterStemmer().stem
+
+    raise ValueError("Unknown stemming method {0}".format(method))
+
+class CachedStemmer(object):
+
+    def __init__(self, method='lemmatize', maxsize=500000):
+        self.method = method
+        self.maxsize = maxsize
+        self.function = stemFunction(method)
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # (word, stem) pairs stemmed since the last takeAdded, or None when not tracked
+        self.added = None
+
+    def __getstate__(self):
+        # the NLTK function is rebuilt rather than pickled
+        state = self.__dict__.copy()
+        del state['function']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.function = stemFunction(self.method)
+
+    def stem(self, word):
+
+        """Stem of word, from the cache when possible"""
+
+        cache = self.cache
+
+        try:
+            value = cache.pop(word)
+            self.hits += 1
+        except KeyError:
+            value = self.function(word)
+            self.misses += 1
+            if self.added != None:
+                self.added.append((word, value))
+            if len(cache) >= self.maxsize:
+                cache.popitem(last=False)
+
+        # reinsert so the most recently used words are at the end
+        cache[word] = value
+
+        return value
+
+    def stemList(self, words):
+        return [self.stem(word) for word in words]
+
+    def stats(self):
+
+        """Hits, misses, size and hit rate of the cache"""
+
+        total = self.hits + self.misses
+        rate = float(self.hits)/total if total else 0.0
+
+        return {'method': self.method, 'hits': self.hits, 'misses': self.misses,
+                'size': len(self.cache), 'hit_rate': rate}
+
+    def items(self):
+        return self.cache.items()
+
+    def track(self):
+
+        """Start keeping the words stemmed, for takeAdded. The hit and miss counts start
+        again from zero, so a forked worker does not send back the counts of its parent"""
+
+        if self.added == None:
+            self.added = []
+            self.hits = 0
+            self.misses = 0
+
+        return
+
+    def takeAdded(self):
+
+        """(words stemmed, hits, misses) since the last call. Resets the counts"""
+
+        taken = (self.added or [], self.hits, self.misses)
+        self.added = [] if self.added != None else None
+        self.hits = 0
+        self.misses = 0
+
+        return taken
+
+    def update(self, items):
+
+        """Add (word, stem) pairs without counting them as hits or misses"""
+
+        for word, value in items:
+            self.cache[word] = value
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+        return
+
+# One CachedStemmer per method for this process
+_stemmers = {}
+_tracking = False
+
+def getStemmer(method='lemmatize'):
+
+    if method not in _stemmers:
+        _stemmers[method] = CachedStemmer(method)
+        if _tracking:
+            _stemmers[method].track()
+
+    return _stemmers[method]
+
+def trackNew():
+
+    """Keep the words every stemmer of this process stems from now on, for takeNew.
+    Used as (or from) a pool initializer"""
+
+    global _tracking
+    _tracking = True
+
+    for stemmer in _stemmers.itervalues():
+        stemmer.track()
+
+    return
+
+def takeNew():
+
+    """{method: (words stemmed, hits, misses)} since the last call, to send back to the parent"""
+
+    return dict((method, stemmer.takeAdded()) for method, stemmer in _stemmers.iteritems())
+
+def mergeNew(new):
+
+    """Add the output of takeNew in a worker to this process's caches and counts"""
+
+    for method, (items, hits, misses) in new.iteritems():
+        stemmer = getStemmer(method)
+        stemmer.update(items)
+        stemmer.hits += hits
+        stemmer.misses += misses
+
+    return
+
+def saveCaches(filename):
+
+    """Write the caches of every stemmer used so far to filename"""
+
+    caches = dict((method, stemmer.items()) for method, stemmer in _stemmers.iteritems())
+
+    with open(filename, 'wb') as f:
+        pickle.dump(caches, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return
+
+def loadCaches(filename):
+
+    """Warm the stemmers with the caches saved in filename. Returns False if there is no file"""
+
+    if not os.path.exists(filename):
+        return False
+
+    with open(filename, 'rb') as f:
+        caches = pickle.load(f)
+
+    for method, items in caches.iteritems():
+        getStemmer(method).update(items)
+
+    return True
+
+def printStats():
+
+    for method, stemmer in sorted(_stemmers.iteritems()):
+        stats = stemmer.stats()
+        print "{0} cache: {1} hits, {2} misses ({3:.1%} hit rate), {4} words".format(method,
+            stats['hits'], stats['misses'], stats['hit_rate'], stats['size'])
+
+    return
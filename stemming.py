@@ -6,55 +6,122 @@ import specialwords as words
 import scrubbing as scrub
 import nltk
 import enron
+import stemcache
+import tokenstore
+import hashlib
+import multiprocessing
+from collections import deque
 from string import digits
 
-def stemmingListofStrings(textsid, stopwords=False):
+
+class Preprocessor(object):
 
     """
-    This function takes a list of tuples (id,text) and returns the text after cleaning, tokenizer and stemming
-    :param textsid: list of tuples with raw text (id,text)
-    :return: returns the stemmed text as a list of tuples (id,stem_text)
+    The cleaning, tokenizing and stemming pipeline of stemmingString, set up once.
+    The stopwords are loaded into a frozenset, and the abbreviation and n-gram matchers,
+    the tokenizer and the (cached) stemmer are built when the object is created, so
+    process() only does the per text work.
     """
 
-    texts = [text for id, text in textsid]
-    ids = [id for id, text in textsid]
+    def __init__(self, stopwords=False, method='lemmatize', abbreviation_file="dic_enron.csv",
+                 N=3, bigram_file="bigrams.txt", trigram_file="trigrams.txt",
+                 tokenizer="regex", stopword_file='add_stopwords.txt'):
+
+        self.abbreviation_file = abbreviation_file
+        self.ngram_files = (N, bigram_file, trigram_file if N == 3 else None)
+        self.tokenizer = tokenizer
+        self.method = method
+
+        if stopwords == True:
+            self.stop_words = frozenset(enron.getCustomStopwords(stopword_file))
+        else:
+            self.stop_words = frozenset()
+
+        # Loads the dictionary and the n-grams now rather than on the first text
+        words.abbreviationMatcher(abbreviation_file)
+        self.joiner = words.ngramJoiner(N, bigram_file, trigram_file)
+        self.tokenize = scrub.getTokenizer(tokenizer)
+        self.stem = stemcache.getStemmer(method).stem
+
+    def config(self):
+
+        """
+        Everything that determines the output of process(), including the contents of the
+        dictionary and n-gram files, for tokenstore.TokenStore
+        """
 
-    # Initialize the stemmer snowball
-    #stem = nltk.stem.snowball.EnglishStemmer()
-    stem = nltk.stem.WordNetLemmatizer()
+        def digest(fname):
+            if fname == None:
+                return None
+            with open(fname, 'rb') as f:
+                return hashlib.md5(f.read()).hexdigest()
 
-    # Clean the text eliminating symbols and numbers
-    texts = [text.translate(None, digits) for text in texts]
-    # texts = [re.sub(r'(.)\1{2}', r'', text) for text in texts]
-    # texts = [re.sub('[\^~+=!-*@#$<>.,;:?|!\-\(\)/"\'\[\]]', '', text.replace('\\','')) for text in texts]
+        N, bigram_file, trigram_file = self.ngram_files
 
-    textsid = zip(ids, texts)
+        return {'abbreviations': digest(self.abbreviation_file),
+                'N': N,
+                'bigrams': digest(bigram_file),
+                'trigrams': digest(trigram_file),
+                'stopwords': hashlib.md5(repr(sorted(self.stop_words))).hexdigest(),
+                'tokenizer': self.tokenizer,
+                'method': self.method,
+                'nltk': getattr(nltk, '__version__', None)}
 
-    # Replace any found term in the dictionary by its abbreviation
-    texts = [words.abbreviations(text.lower(), "dic_enron.csv", id) for id, text in textsid]
+    def process(self, text, id=None):
 
-    textsid = zip(ids, texts)
+        """
+        Returns the text after cleaning, tokenizing and stemming, as a list of stems
+        :param text: raw text
+        :param id: id of the text, used in the audit files
+        """
 
-    # Joins any ngrams found in the given files
-    texts = [words.ngramsText(text.lower(), 3, "bigrams.txt", "trigrams.txt", id) for id, text in textsid]
+        stop_words = self.stop_words
+        stem = self.stem
 
-    # Tokenize the texts and eliminates stopwords and all words with length < 2
-    texts_token = [scrub.tokenizeString(text, lower=True, tokenizer="punktword") for text in texts]
+        # Clean the text eliminating numbers
+        text = text.translate(None, digits)
 
-    if stopwords == True:
-        #Initialize the stop words
-        stop_words = enron.getCustomStopwords()
-        texts_token = [[x for x in text_token if x not in stop_words and len(x) > 1] for text_token in texts_token]
-    elif stopwords == False:
-        texts_token = [[x for x in text_token if len(x) > 1] for text_token in texts_token]
+        # Replace any found term in the dictionary by its abbreviation
+        text = words.abbreviations(text.lower(), self.abbreviation_file, id)
 
-    # Apply stemming
-    #texts_stem = [[stem.stem(word) for word in text_token] for text_token in texts_token]
-    texts_stem = [[stem.lemmatize(word) for word in text_token] for text_token in texts_token]
+        # Joins any ngrams found in the given files
+        text = self.joiner.join(text.lower(), id)
 
-    textsid = zip(ids, texts_stem)
+        # Tokenize, eliminate stopwords and all words with length < 2, and stem
+        return [stem(word) for word in (w.lower() for w in self.tokenize(text))
+                if len(word) > 1 and word not in stop_words]
 
-    return textsid
+    def process_many(self, textsid):
+
+        """
+        Generator over (id, stemmed text) for an iterable of (id, text)
+        """
+
+        for id, text in textsid:
+            yield id, self.process(text, id)
+
+# Preprocessor objects already built, by configuration
+_preprocessors = {}
+
+def getPreprocessor(stopwords=False, **kwargs):
+
+    """Returns the Preprocessor for this configuration, building it the first time it is needed"""
+
+    key = (stopwords == True, tuple(sorted(kwargs.items())))
+    if key not in _preprocessors:
+        _preprocessors[key] = Preprocessor(stopwords=stopwords, **kwargs)
+
+    return _preprocessors[key]
+
+def stemmingListofStrings(textsid, stopwords=False):
+
+    """
+    This function takes a list of tuples (id,text) and returns the text after cleaning, tokenizer and stemming
+    :param textsid: list of tuples with raw text (id,text)
+    :return: returns the stemmed text as a list of tuples (id,stem_text)
+    """
+
+    return list(getPreprocessor(stopwords).process_many(textsid))
 
 
 def stemmingString(text, id, stopwords=False):
@@ -65,32 +132,150 @@ def stemmingString(text, id, stopwords=False):
     :return: returns the stemmed text
     """
 
-    # Initialize the stemmer snowball
-    #stem = nltk.stem.snowball.EnglishStemmer()
-    stem = nltk.stem.WordNetLemmatizer()
+    return getPreprocessor(stopwords).process(text, id)
+
+
+# Preprocessor of this pool worker, built once by initWorker
+worker_preprocessor = None
+
+def initWorker(stopwords, kwargs):
+
+    """Pool initializer: build the worker's Preprocessor before it gets any text"""
+
+    global worker_preprocessor
+    stemcache.trackNew()
+    worker_preprocessor = getPreprocessor(stopwords, **kwargs)
+
+    return
+
+def processChunk(chunk):
+
+    """Worker for stemmingParallel: preprocess a list of (id, text).
+    Returns the results and the new stem cache entries (see stemcache.takeNew)"""
+
+    results = [(id, worker_preprocessor.process(text, id)) for id, text in chunk]
+
+    return results, stemcache.takeNew()
+
+def mergeChunk(output):
+
+    """The results of processChunk, after adding its stem cache entries to this process's caches"""
+
+    results, new = output
+    stemcache.mergeNew(new)
+
+    return results
+
+def chunked(iterable, chunksize):
+
+    chunk = []
+
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+def stemmingParallel(textsid, stopwords=False, workers=None, chunksize=100, **kwargs):
+
+    """
+    Generator with the output of stemmingListofStrings, computed by a pool of worker processes.
+    textsid can be any iterable of (id,text), e.g. enron.streamTexts(). It is read chunksize texts
+    at a time and at most 2*workers chunks are in flight, so memory stays bounded on the whole table.
+    The results come back in the same order as textsid whatever the number of workers.
+    Any other keyword arguments configure the Preprocessor (see Preprocessor.__init__)
+    :param textsid: iterable of tuples with raw text (id,text)
+    :return: generator over tuples (id,stem_text)
+    """
+
+    if workers == None:
+        workers = multiprocessing.cpu_count()
+
+    pool = multiprocessing.Pool(processes = workers, initializer = initWorker, initargs = (stopwords, kwargs))
+    pending = deque()
+
+    try:
+
+        for chunk in chunked(textsid, chunksize):
+
+            pending.append(pool.apply_async(processChunk, (chunk,)))
+
+            if len(pending) >= 2*workers:
+                for result in mergeChunk(pending.popleft().get()):
+                    yield result
+
+        while pending:
+            for result in mergeChunk(pending.popleft().get()):
+                yield result
+
+        pool.close()
+
+    except:
+
+        pool.terminate()
+        raise
+
+    finally:
+
+        pool.join()
+
+def tokenStore(directory='token_store', stopwords=False, **kwargs):
+
+    """Opens the tokenstore.TokenStore for this preprocessing configuration"""
+
+    return tokenstore.TokenStore(directory, getPreprocessor(stopwords, **kwargs).config())
+
+def stemmingStored(textsid, store, stopwords=False, workers=1, chunksize=100, **kwargs):
+
+    """
+    Generator with the output of stemmingListofStrings that reads the tokens of each email from
+    store (see tokenStore) when they are there, and only stems the others, adding them to the store.
+    With workers > 1 the emails that need stemming are done by a pool of worker processes.
+    :param textsid: iterable of tuples with raw text (id,text)
+    :return: generator over tuples (id,stem_text)
+    """
+
+    if workers > 1:
+        pool = multiprocessing.Pool(processes = workers, initializer = initWorker, initargs = (stopwords, kwargs))
+    else:
+        preprocessor = getPreprocessor(stopwords, **kwargs)
+
+    try:
+
+        for batch in chunked(textsid, 4*chunksize*max(workers, 1)):
+
+            stored = [store.get(id, text) for id, text in batch]
+            missing = [item for item, tokens in zip(batch, stored) if tokens == None]
+
+            if not missing:
+                computed = []
+            elif workers > 1:
+                computed = [result for output in pool.map(processChunk, list(chunked(missing, chunksize)))
+                            for result in mergeChunk(output)]
+            else:
+                computed = list(preprocessor.process_many(missing))
+
+            computed = iter(computed)
 
-    # Clean the text eliminating symbols and numbers
-    text = text.translate(None, digits)
-    # text = re.sub(r'(.)\1{2}', r'', text)
-    # text = re.sub('[\^~+=!-*@#$<>.,;:?!|\-\(\)/"\'\[\]]', '', text.replace('\\',''))
+            for (id, text), tokens in zip(batch, stored):
+                if tokens == None:
+                    tokens = next(computed)[1]
+                    store.put(id, text, tokens)
+                yield id, tokens
 
-    # Replace any found term in the dictionary by its abbreviation
-    text = words.abbreviations(text.lower(), "dic_enron.csv", id)
+        if workers > 1:
+            pool.close()
 
-    # Joins any ngrams found in the given files
-    text = words.ngramsText(text.lower(), 3, "bigrams.txt", "trigrams.txt", id)
+    except:
 
-    # Tokenize the texts and eliminates stopwords and all words with length < 2
-    text_token = scrub.tokenizeString(text, lower=True, tokenizer="punktword")
-    if stopwords == True:
-        #Initialize the stop words
-        stop_words = enron.getCustomStopwords()
-        text_token = [x for x in text_token if x not in stop_words and len(x) > 1]
-    elif stopwords == False:
-        text_token = [x for x in text_token if len(x) > 1]
+        if workers > 1:
+            pool.terminate()
+        raise
 
-    # Apply stemming
-    #text_stem = [stem.stem(word) for word in text_token]
-    text_stem = [stem.lemmatize(word) for word in text_token]
+    finally:
 
-    return text_stem
+        if workers > 1:
+            pool.join()
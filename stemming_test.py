@@ -1,103 +1,330 @@
 #!/usr/env/python
 
-"""We can use the getattr() function to test a whole range of functions/set-ups/combinations
-in one place
+"""Benchmark of every tokeniser/stemmer combination on a sample of emails.
+
+Each combination runs in its own worker process, so the peak resident memory it
+reports belongs to that combination alone. It is run a number of times untimed to
+warm up, then timed over several repeats. The stems are written to
+testing_<tokeniser>_<stemmer>.csv as before, the timings to the timings log, and
+everything measured, together with the git commit and library versions, to a JSON
+file so runs on different commits can be compared.
 
 To use this at the command line use the following:
 
 python stemming_test.py --help (will output the correctly formatted help command)
-python stemming_test.py -f 0.01 [-o mytimingsoutput.log]
+python stemming_test.py -f 0.01 [-o mytimingsoutput.log] [-r 5] [-w 1] [-p 4] [-j results.json]
+python stemming_test.py -t
 
 -f is the fraction of the dataset you want to work on
 -o an option to change the name of the output file for the timings, otherwise it writes to timings.log
+-r number of timed repeats, the best one is reported as tokens per second
+-w number of untimed warm-up runs
+-p number of combinations run at the same time. Timings are only comparable with -p 1
+-j name of the JSON results file, otherwise it writes to benchmark.json
+-t only run the checks below and exit
+
+The tokenizers are always checked against the golden file first: its texts were
+tokenized by hand following NLTK 2's WordPunctTokenizer and PunktWordTokenizer, and
+the regex tokenizers ("regexwordpunct", and "regex", the default of
+stemming.Preprocessor) must give exactly the same tokens. The stem cache counts
+that pool workers send back to their parent (stemcache.takeNew/mergeNew) are checked
+too, after warming the parent's cache before the fork. The benchmark does not run
+if any check fails.
 """
 
 
-import os, shutil
+import os, shutil, sys
 import gensim
 import nltk
-from nltk.corpus import stopwords
-import MySQLdb as mdb
 import enron
-import pdb
-import os
 import csv
+import json
+import platform
+import resource
+import subprocess
 import time
 import argparse
+import multiprocessing
 import specialwords as words
+import scrubbing as scrub
+import stemcache
 
-def getFunctionName(fstring):
-
-    """Get function/module names from the command input"""
-
-    t1 = fstring.split()
-    t2 = t1[-1][2:].strip('()')
-    return t2
 
 def cleanTokens(tokens,minlen=2):
     output=[]
     disallowedchar=set(["!","?",'"',"'",",",".",":",";","-","<",">", "/","="])
 
     for i in tokens:
-        if ((len(set(i).intersection(disallowedchar)) == 0) and 
-            (not i.endswith('dn')) and 
+        if ((len(set(i).intersection(disallowedchar)) == 0) and
+            (not i.endswith('dn')) and
             (len(i) > minlen)):
             output.append(i)
-        
+
     return output
 
+# tokenizer name -> field of the golden file with the tokens it has to give
+GOLDEN_FILE = 'tokenizer_golden.json'
+GOLDEN_TOKENIZERS = [
+    ('wordpunct', 'wordpunct'),
+    ('regexwordpunct', 'wordpunct'),
+    ('punktword', 'punktword'),
+    ('regex', 'punktword'),
+]
+
+def checkTokenizers(filename=GOLDEN_FILE):
+
+    """Tokenize every text of the golden file with each tokenizer of GOLDEN_TOKENIZERS.
+    Returns a list of the differences, empty if they all give the expected tokens"""
+
+    with open(filename) as f:
+        cases = json.load(f)
+
+    failures = []
+
+    for tokenizer, expected in GOLDEN_TOKENIZERS:
+
+        tokenize = scrub.getTokenizer(tokenizer)
+
+        for case in cases:
+
+            tokens = tokenize(case['text'])
+
+            if tokens != case[expected]:
+                failures.append('{0} on {1!r}: {2!r}, expected {3!r}'.format(tokenizer, case['text'],
+                    tokens, case[expected]))
+
+    return failures
+
+def cacheWorker(words):
+
+    """Pool worker for checkCacheMerge: stem words with the shared porter stemmer"""
+
+    stemcache.getStemmer('porter').stemList(words)
+
+    return stemcache.takeNew()
+
+def checkCacheMerge():
+
+    """Warm the porter cache, fork a pool of workers that track their caches, and merge
+    what they send back. Returns a list of the differences with the expected counts"""
+
+    stemmer = stemcache.getStemmer('porter')
+
+    # counted in the parent before the fork: the workers must not send these back
+    stemmer.stemList(['running', 'runs', 'running', 'runs'])
+    hits, misses = stemmer.hits, stemmer.misses
+
+    # one task per fresh worker, each forked from the warm parent:
+    # running is a hit, jumped a miss then a hit, connection a miss
+    chunks = [['running', 'jumped', 'jumped'], ['runs', 'connection']]
+
+    pool = multiprocessing.Pool(processes = 2, initializer = stemcache.trackNew, maxtasksperchild = 1)
+    outputs = pool.map(cacheWorker, chunks, chunksize = 1)
+    pool.close()
+    pool.join()
+
+    for new in outputs:
+        stemcache.mergeNew(new)
+
+    failures = []
+
+    expected = {'hits': hits + 3, 'misses': misses + 2}
+
+    for name, count in sorted(expected.items()):
+        if getattr(stemmer, name) != count:
+            failures.append('porter cache {0}: {1}, expected {2}'.format(name, getattr(stemmer, name), count))
+
+    for word in ('jumped', 'connection'):
+        if word not in stemmer.cache:
+            failures.append('porter cache: {0} stemmed by a worker is missing'.format(word))
+
+    return failures
+
+def gensimTokenize(text):
+    return list(gensim.utils.tokenize(text))
+
+def gensimLemmatize(tokens):
+
+    """gensim lemmatizes a whole text at once rather than word by word"""
+
+    return gensim.utils.lemmatize(' '.join(tokens))
+
+# (name, function returning the tokenize function). The names are the ones used in the output files,
+# so they must not contain underscores (tokenisation_summary.py splits the file names on them)
+TOKENIZERS = [
+    ('nltk.tokenize.WordPunctTokenizer.tokenize', lambda: scrub.getTokenizer('wordpunct')),
+    ('nltk.tokenize.PunktWordTokenizer.tokenize', lambda: scrub.getTokenizer('punktword')),
+    ('gensim.utils.tokenize', lambda: gensimTokenize),
+    ('scrubbing.regex.findall', lambda: scrub.getTokenizer('regex')),
+]
+
+# (name, function returning the stem function, True if it stems a whole list of tokens at once)
+STEMMERS = [
+    ('nltk.stem.snowball.EnglishStemmer.stem', lambda: stemcache.stemFunction('snowball'), False),
+    ('nltk.stem.snowball.PorterStemmer.stem', lambda: stemcache.stemFunction('porter'), False),
+    ('nltk.stem.lancaster.LancasterStemmer.stem', lambda: stemcache.stemFunction('lancaster'), False),
+    ('nltk.stem.WordNetLemmatizer.lemmatize', lambda: stemcache.stemFunction('lemmatize'), False),
+    ('gensim.utils.lemmatize', lambda: gensimLemmatize, True),
+]
+
+# Set by main before the worker processes are forked
+sample_texts = []
+stop_words = frozenset()
+
+def runOnce(tokenize, stem, whole):
+
+    """Tokenize and stem every text of the sample once.
+    Returns (stems, number of tokens, tokenizing time, stemming time)"""
+
+    stems = []
+    ntokens = 0
+    tokenizetime = 0.
+    stemtime = 0.
+
+    for text in sample_texts:
+
+        start = time.time()
+        tokens = [x for x in cleanTokens(tokenize(text)) if x not in stop_words]
+        middle = time.time()
+
+        if whole:
+            stems.extend(stem(tokens))
+        else:
+            stems.extend([stem(word) for word in tokens])
+
+        end = time.time()
+
+        ntokens += len(tokens)
+        tokenizetime += middle - start
+        stemtime += end - middle
+
+    return stems, ntokens, tokenizetime, stemtime
+
+def benchmark(job):
+
+    """Worker: warm up, time and write out one tokeniser/stemmer combination"""
+
+    tokenizer, stemmer, warmup, repeats, output = job
+
+    result = {'tokenizer': tokenizer, 'stemmer': stemmer, 'output': os.path.basename(output)}
+
+    try:
+
+        tokenize = dict((name, f) for name, f in TOKENIZERS)[tokenizer]()
+        stemfactory, whole = dict((name, (f, w)) for name, f, w in STEMMERS)[stemmer]
+        stem = stemfactory()
+
+        for i in range(warmup):
+            runOnce(tokenize, stem, whole)
+
+        times = []
+
+        for i in range(repeats):
+            stems, ntokens, tokenizetime, stemtime = runOnce(tokenize, stem, whole)
+            times.append((tokenizetime + stemtime, tokenizetime, stemtime))
+
+        best = min(times)
+
+        start_write = time.time()
+
+        with open(output, "wb") as f:
+            writer = csv.writer(f)
+            writer.writerows([stems])
+
+        writetime = time.time() - start_write
+
+        result.update({
+            'tokens': ntokens,
+            'stems': len(stems),
+            'times': [t[0] for t in times],
+            'best': best[0],
+            'median': sorted(t[0] for t in times)[len(times)//2],
+            'tokenize_time': best[1],
+            'stem_time': best[2],
+            'tokens_per_sec': ntokens/best[0] if best[0] > 0 else None,
+            'writetime': writetime,
+        })
+
+    except Exception as e:
+
+        result['error'] = '{0}: {1}'.format(type(e).__name__, e)
+
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return result
+
+def gitCommit():
+
+    """Commit of the working tree, marked -dirty if it has uncommitted changes"""
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+        if subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no']).strip():
+            commit += '-dirty'
+        return commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
 parser = argparse.ArgumentParser(description="Testing the different tokenisation/stemming methods")
-parser.add_argument('-f', '--fraction', help = 'Fraction of sample required', required = True, type=float)
+parser.add_argument('-f', '--fraction', help = 'Fraction of sample required', type=float)
 parser.add_argument('-o', '--output_timelog', help = 'Output logname for timings', default = 'timings.log', type = str)
 parser.add_argument('-n', '--ngrams', help='Remove ngrams', default = False, action = 'store_true')
 parser.add_argument('-a', '--abbrev', help='Replace abbreviations', default = False, action = 'store_true')
 parser.add_argument('-e', '--email_list', help = 'Use existing email log', type = str)
 parser.add_argument('-d', '--directory', help = 'Output sub-directory name. Defaults to output', type=str, default='output')
+parser.add_argument('-r', '--repeats', help = 'Number of timed runs of each combination', default = 3, type=int)
+parser.add_argument('-w', '--warmup', help = 'Number of untimed runs before timing', default = 1, type=int)
+parser.add_argument('-p', '--parallel', help = 'Number of combinations run at the same time', default = 1, type=int)
+parser.add_argument('-j', '--json', help = 'Output name for the JSON results', default = 'benchmark.json', type=str)
+parser.add_argument('-t', '--check-tokenizers', help = 'Only check the tokenizers against {0} and the stem cache merge'.format(GOLDEN_FILE),
+                    default = False, action = 'store_true', dest = 'check_tokenizers')
 
 
 
 def main():
 
+    global sample_texts, stop_words
+
     args = parser.parse_args()
 
-    rootdir=os.getcwd()
-    foldername=args.directory
-    folderpath=os.path.join(rootdir,foldername)
-    if (os.path.exists(folderpath)==True):
-        shutil.rmtree(folderpath)
-        os.makedirs(folderpath)
-    else:
-        os.makedirs(folderpath)
+    if args.fraction == None and not args.check_tokenizers:
+        parser.error('argument -f/--fraction is required')
 
-    stop_words = enron.getCustomStopwords()
+    failures = checkTokenizers()
 
+    for failure in failures:
+        print failure
 
-    
+    if failures:
+        print '{0} tokenizer differences with {1}'.format(len(failures), GOLDEN_FILE)
+        sys.exit(1)
 
-    timinglog = open(os.path.join(folderpath,args.output_timelog), 'w')
+    print 'Tokenizers match {0}'.format(GOLDEN_FILE)
 
-    timinglog.write('#Tokeniser Stemmer/Lemmatiser Codetime Writetime\n')
-    
-    
-    
-    # NB if you make changes here also do it below for the args/kwargs
+    failures = checkCacheMerge()
 
+    for failure in failures:
+        print failure
 
-    token_command = [
-    				["nltk", "f = p.tokenize.WordPunctTokenizer()", "tokenize"],
-    				["nltk", "f = p.tokenize.PunktWordTokenizer()", "tokenize"],
-    		      	["gensim", "f = p.utils", "tokenize"]
+    if failures:
+        sys.exit(1)
 
-    ]
-    
-    stem_command = [
-    				["nltk", "g = q.stem.snowball.EnglishStemmer()", "stem"],
-    				["nltk", "g = q.stem.snowball.PorterStemmer()", "stem"],
-    				["nltk", "g = q.stem.lancaster.LancasterStemmer()", "stem"],
-    	       	   	["nltk", "g = q.stem.WordNetLemmatizer()", "lemmatize"],
-    				["gensim", "g = q.utils", "lemmatize"]
-    ]
+    print 'Stem cache counts from the workers merge correctly'
 
+    if args.check_tokenizers:
+        return
+
+    rootdir=os.getcwd()
+    foldername=args.directory
+    folderpath=os.path.join(rootdir,foldername)
+    if (os.path.exists(folderpath)==True):
+        shutil.rmtree(folderpath)
+        os.makedirs(folderpath)
+    else:
+        os.makedirs(folderpath)
+
+    stop_words = frozenset(enron.getCustomStopwords())
 
     #Either get text as new random sample, or use existing list
 
@@ -123,17 +350,7 @@ def main():
 
         email_sample = [e.strip('\n') for e in email_sample]
 
-        con,cur = enron.connectDB('enron')
-
-        text = []
-
-        for e_id in email_sample:
-
-            cur.execute(" select text from emails where id = {0} ".format(e_id))
-            tmp=cur.fetchall()
-            text.append(tmp[0][0])
-
-        con.close()
+        text = [t for e_id, t in enron.streamIds([int(e) for e in email_sample])]
 
 
         #make email log file anyway
@@ -146,123 +363,86 @@ def main():
 
                 elog.write('{0}\n'.format(e_id))
 
-        
-
 
+    # Each email is processed on its own rather than joined into one string
 
     text = [t.lower() for t in text]
 
-    text = ' '.join(text)
-
     if (args.abbrev == True):
 
-        if os.path.exists("word_replace_dic.txt"):
-            os.remove("word_replace_dic.txt")
-
         print "Replacing technical terms..."
-        text=words.abbreviations(text,"dic_enron.csv")
-
-
-
+        text = [words.abbreviations(t,"dic_enron.csv") for t in text]
 
     if (args.ngrams == True):
 
-        if os.path.exists("ngrams_found.txt"):
-            os.remove("ngrams_found.txt")
         print "Joining ngrams..."
-        text=words.ngramsText(text,3,"bigrams.txt","trigrams.txt")
-
-
-    token_args = [
-                text,
-                text, 
-                text
-                ]
-    token_kwargs = [
-                {},
-                {},
-                {}
-                ]
-    
-    stem_kwargs = [
-                {}, 
-                {}, 
-                {}, 
-                {}, 
-                {}
-                ]
+        text = [words.ngramsText(t,3,"bigrams.txt","trigrams.txt") for t in text]
 
-    
-    #loop over each version
+    sample_texts = text
 
+    megabytes = sum(len(t) for t in text)/1e6
 
-    for (tcommand, targ, tkwarg) in zip(token_command, token_args, token_kwargs):
-    
+    print '{0} emails, {1:.1f} MB'.format(len(text), megabytes)
 
-        for (scommand, skwarg) in zip(stem_command, stem_kwargs):
+    if args.parallel > 1:
+        print 'Running {0} combinations at a time: timings are not comparable with serial runs'.format(args.parallel)
 
-            n1 = tcommand[0]
-            n2 = getFunctionName(tcommand[1])+'.'+tcommand[2]
-            n3 = scommand[0]
-            n4 = getFunctionName(scommand[1])+'.'+scommand[2]
-    
-            output = os.path.join(folderpath,'testing_{0}.{1}_{2}.{3}.csv'.format(n1,n2,n3,n4))
+    jobs = []
 
-            print 'Currently working on {0}.{1} with {2}.{3}'.format(n1,n2,n3,n4)
-        
+    for tokenizer, tfactory in TOKENIZERS:
+        for stemmer, sfactory, whole in STEMMERS:
+            output = os.path.join(folderpath,'testing_{0}_{1}.csv'.format(tokenizer, stemmer))
+            jobs.append((tokenizer, stemmer, args.warmup, args.repeats, output))
 
-            start_code = time.time()
+    # A fresh process per combination so ru_maxrss is the peak of that combination only
+    pool = multiprocessing.Pool(processes = args.parallel, maxtasksperchild = 1)
 
-            p = __import__(tcommand[0])
-            exec tcommand[1]
-            text_token = list(getattr(f, tcommand[2])(targ,**tkwarg))
+    results = []
 
-            #tokenising complete
+    with open(os.path.join(folderpath,args.output_timelog), 'w') as timinglog:
 
-            text_token = cleanTokens(text_token)
+        timinglog.write('#Tokeniser Stemmer/Lemmatiser Codetime Writetime\n')
 
-            text_token = [x for x in text_token if x not in stop_words]
-    
-            q = __import__(scommand[0])
-            exec scommand[1]
-    
-            if scommand[0] == 'gensim':
-    
-            	text_stem  = getattr(g, scommand[2])(unicode(text_token))
-    
-            
-            else:
+        for result in pool.imap(benchmark, jobs):
 
-    
-            	text_stem = [getattr(g, scommand[2])(word) for word in text_token]
-    
-    
-            
-    
-            end_code = time.time()
+            results.append(result)
 
-            codetime = end_code - start_code
+            if 'error' in result:
+                print '{0} with {1} failed: {2}'.format(result['tokenizer'], result['stemmer'], result['error'])
+                continue
 
-            print 'Total time for set-up: {0}'.format(codetime)
+            print '{0} with {1}: {2:.0f} tokens/sec, best {3:.2f} sec, peak RSS {4:.0f} MB'.format(result['tokenizer'],
+                result['stemmer'], result['tokens_per_sec'] or 0, result['best'], result['peak_rss_kb']/1024.)
 
-            start_write = time.time()
+            timinglog.write("{0}\t{1}\t{2}\t{3}\n".format(result['tokenizer'], result['stemmer'],
+                result['best'], result['writetime']))
 
-            with open(os.path.join(folderpath,output), "wb") as f:
-                writer = csv.writer(f)  
-                writer.writerows([text_stem])
+    pool.close()
+    pool.join()
 
-            end_write = time.time()
+    summary = {
+        'commit': gitCommit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'nltk': getattr(nltk, '__version__', None),
+        'gensim': getattr(gensim, '__version__', None),
+        'emails': len(text),
+        'megabytes': megabytes,
+        'fraction': args.fraction,
+        'email_list': args.email_list,
+        'abbrev': args.abbrev,
+        'ngrams': args.ngrams,
+        'warmup': args.warmup,
+        'repeats': args.repeats,
+        'parallel': args.parallel,
+        'results': results,
+    }
 
-            writetime = end_write - start_write
-    
-            print 'Total time for write out: {0}'.format(writetime)
+    with open(os.path.join(folderpath,args.json), 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
 
-            timinglog.write("{0}.{1}\t{2}.{3}\t{4}\t{5}\n".format(n1, n2, n3, n4, codetime, writetime))
-
-    timinglog.close()
+    print 'Results written to {0}'.format(os.path.join(folderpath,args.json))
 
 
 if __name__ == '__main__':
     main()
-
-
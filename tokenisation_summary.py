@@ -2,7 +2,13 @@
 
 """Examing the output from the csv files generated in the stemming_test.py
 script and pull out the most common words and their frequency.  Also use
-the dictionary to search for non-English words"""
+the dictionary to search for non-English words
+
+With --streaming the files are read a block at a time and summarised in fixed
+memory (see sketches.py): the number of unique tokens is a HyperLogLog estimate
+and the most common tokens come from a Space-Saving summary of --top counters.
+The files are then summarised in parallel by --workers processes. The pickle has
+the same fields either way."""
 
 import argparse
 import glob
@@ -10,76 +16,161 @@ from collections import Counter
 import os
 import cPickle as pickle
 import math
-import pdb
+import multiprocessing
+import sketches
 
 parser = argparse.ArgumentParser(description='Run some tests on the output files from stemming_test.py')
 parser.add_argument('directory', help='Directory where you are keeping the files', type = str)
 parser.add_argument('-s', '--savepickle', help='Save some output in a pickle', action='store_true', default=False)
+parser.add_argument('--streaming', help='Summarise the files in fixed memory, with approximate unique counts',
+                    action='store_true', default=False)
+parser.add_argument('--workers', help='Number of files summarised at the same time with --streaming',
+                    default=1, type=int)
+parser.add_argument('--top', help='Number of counters kept for the most common tokens with --streaming',
+                    default=10000, type=int)
+parser.add_argument('--precision', help='HyperLogLog precision with --streaming (2**p registers)',
+                    default=14, type=int)
 
-def main():
+def fileNames(foundfile):
 
-    args = parser.parse_args()
+    """(tokeniser, stemmer) from a testing_<tokeniser>_<stemmer>.csv file name"""
 
-    print args
+    fname = os.path.splitext(os.path.basename(foundfile))[0].split('_')
 
-    #add trailing / if necessary
+    return fname[1], fname[2]
 
-    if (args.directory[-1] != '/'): 
-        args.directory = args.directory+'/'
+def readTokens(foundfile, blocksize=1<<20):
 
-    findcsv = glob.glob('{0}testing_*.csv'.format(args.directory))
+    """Generator over the tokens of a file, split on commas exactly as
+    f.read().strip('\\r\\n').split(',') would, but a block at a time"""
 
-    print 'Found {0} files:'.format(len(findcsv))
+    carry = ''
+    started = False
+
+    with open(foundfile, 'r') as f:
 
-    results_dict = [{'tokeniser':'', 'stemmer':'', 'tokens':0, 'unique':0, 'most_common':[], 'over_500':[]} for f in findcsv]
+        while True:
 
-    for i,foundfile in enumerate(findcsv):
+            block = f.read(blocksize)
 
-        with open(foundfile, 'r') as f:
-            data = f.read()
+            if not block:
+                break
 
-        fname = os.path.splitext(os.path.basename(foundfile))[0].split('_')
-        tokeniser = fname[1]
-        stemmer = fname[2]
+            if not started:
+                block = block.lstrip('\r\n')
+                if not block:
+                    continue
+                started = True
 
-        data = data.strip('\r\n').split(',')
+            pieces = (carry + block).split(',')
+            carry = pieces.pop()
 
+            for token in pieces:
+                yield token
 
+    yield carry.rstrip('\r\n')
 
-        data_unique = set(data)
+def summariseFile(foundfile):
 
-        counter = Counter(data)
+    """The summary of one file, counting every token exactly"""
 
-        most_common = counter.most_common()[0:50]
+    tokeniser, stemmer = fileNames(foundfile)
 
-        all_common = dict((k,v) for k,v in counter.items() if v >=3000)
+    with open(foundfile, 'r') as f:
+        data = f.read()
 
-        total_tokens  = len(data_unique)
-        
-        final_tokens = counter.most_common()[10:]
-        final_tokens2 = dict((k,v) for k,v in final_tokens if v >=10)
+    data = data.strip('\r\n').split(',')
 
+    data_unique = set(data)
 
-        print '************************************'
-        print 'Tokeniser: {0}'.format(tokeniser)
-        print 'Stemmer: {0}'.format(stemmer)
-        print 'Token number: {0}'.format(len(data))
-        print 'Unique tokens: {0}'.format(len(data_unique))
-        #print '50 Most Common Words: '
-        #print most_common
-        #print 'All words > 3000 frequency:'
-        #print all_common
-        #print ''
-        #print len(all_common)
-        print len(final_tokens2)
+    counter = Counter(data)
 
-        results_dict[i]['tokeniser'] = tokeniser
-        results_dict[i]['stemmer'] = stemmer
-        results_dict[i]['tokens'] = len(data)
-        results_dict[i]['unique'] = len(data_unique)
-        results_dict[i]['most_common'] = most_common
-        results_dict[i]['over_500'] = all_common
-        pdb.set_trace()
+    most_common = counter.most_common()[0:50]
+
+    all_common = dict((k,v) for k,v in counter.items() if v >=3000)
+
+    final_tokens = counter.most_common()[10:]
+    final_tokens2 = dict((k,v) for k,v in final_tokens if v >=10)
+
+    print '************************************'
+    print 'Tokeniser: {0}'.format(tokeniser)
+    print 'Stemmer: {0}'.format(stemmer)
+    print 'Token number: {0}'.format(len(data))
+    print 'Unique tokens: {0}'.format(len(data_unique))
+    print len(final_tokens2)
+
+    return {'tokeniser': tokeniser, 'stemmer': stemmer, 'tokens': len(data), 'unique': len(data_unique),
+            'most_common': most_common, 'over_500': all_common}
+
+def summariseStream(job):
+
+    """The summary of one file in fixed memory. Tokens are counted exactly a block at a
+    time, and each block is then added to the sketches"""
+
+    foundfile, top, precision, blocktokens = job
+
+    tokeniser, stemmer = fileNames(foundfile)
+
+    hll = sketches.HyperLogLog(precision)
+    heavy = sketches.SpaceSaving(top)
+    total = 0
+    block = Counter()
+
+    for token in readTokens(foundfile):
+
+        block[token] += 1
+        total += 1
+
+        # a block with many distinct tokens is flushed to keep memory bounded
+        if len(block) >= blocktokens:
+            hll.update(block)
+            heavy.update(block)
+            block = Counter()
+
+    hll.update(block)
+    heavy.update(block)
+
+    unique = hll.count()
+
+    print '************************************'
+    print 'Tokeniser: {0}'.format(tokeniser)
+    print 'Stemmer: {0}'.format(stemmer)
+    print 'Token number: {0}'.format(total)
+    print 'Unique tokens (estimated): {0}'.format(unique)
+
+    return {'tokeniser': tokeniser, 'stemmer': stemmer, 'tokens': total, 'unique': unique,
+            'most_common': heavy.most_common(50), 'over_500': heavy.over(3000)}
+
+def main():
+
+    args = parser.parse_args()
+
+    print args
+
+    #add trailing / if necessary
+
+    if (args.directory[-1] != '/'):
+        args.directory = args.directory+'/'
+
+    findcsv = glob.glob('{0}testing_*.csv'.format(args.directory))
+
+    print 'Found {0} files:'.format(len(findcsv))
+
+    if args.streaming:
+
+        jobs = [(foundfile, args.top, args.precision, 100000) for foundfile in findcsv]
+
+        if args.workers > 1:
+            pool = multiprocessing.Pool(processes = args.workers)
+            results_dict = pool.map(summariseStream, jobs, chunksize = 1)
+            pool.close()
+            pool.join()
+        else:
+            results_dict = [summariseStream(job) for job in jobs]
+
+    else:
+
+        results_dict = [summariseFile(foundfile) for foundfile in findcsv]
 
     print '************************************'
 
@@ -89,9 +180,9 @@ def main():
         with open('tokeniser_stats.pkl', 'wb') as output:
             pickle.dump(results_dict, output)
         print 'Written pickle {0}'.format('tokeniser_stats.pkl')
-        
+
 
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,99 @@
+#!/usr/env/python
+
+"""Checks the precompiled regex tokenizers in scrubbing.py against the NLTK tokenizers
+they replace, and compares their throughput. Every text of the sample has to give
+exactly the same tokens before any timings are reported. stemming_test.py -t checks
+the same tokenizers against the hand-checked tokens of tokenizer_golden.json, which
+does not need the database.
+
+To use this at the command line use the following:
+
+python tokenizer_benchmark.py -f 0.01 [-r 3] [-s 123] [-c text]
+python tokenizer_benchmark.py -i golden_sample.txt [-r 3]
+
+-f is the fraction of the emails you want to work on
+-i a text file to use instead of the database, one text per line
+-r the number of times each tokenizer is run over the sample (the best time is kept)
+-s seed for the random sample
+-c column of the emails table to sample
+"""
+
+import argparse
+import math
+import random
+import time
+import enron
+import scrubbing as scrub
+from nltk.tokenize import WordPunctTokenizer
+from clean_benchmark import timeFunction
+
+
+def sampleColumn(fraction, column='text', seed=None):
+
+    """Random sample of a column of the emails table"""
+
+    size = enron.lastId()
+
+    if seed != None:
+        random.seed(seed)
+
+    sample = random.sample(range(1, size+1), int(math.floor(size*fraction)))
+
+    return [text for id, text in enron.streamIds(sample, column=column) if text != None]
+
+def countTokens(function, texts):
+    return sum(len(function(text)) for text in texts)
+
+parser = argparse.ArgumentParser(description="Regex tokenizers against the NLTK ones")
+parser.add_argument('-f', '--fraction', help = 'Fraction of the emails to sample', default = 0.01, type=float)
+parser.add_argument('-i', '--input', help = 'Text file with one text per line, instead of the database', default = None, type=str)
+parser.add_argument('-r', '--repeats', help = 'Number of timed runs over the sample', default = 3, type=int)
+parser.add_argument('-s', '--seed', help = 'Seed for the random sample', default = None, type=int)
+parser.add_argument('-c', '--column', help = 'Column of the emails table to sample', default = 'text', type=str)
+
+def main():
+
+    args = parser.parse_args()
+
+    if args.input != None:
+        with open(args.input) as f:
+            texts = [line.rstrip('\n') for line in f]
+    else:
+        texts = sampleColumn(args.fraction, args.column, args.seed)
+
+    megabytes = sum(len(t) for t in texts)/1e6
+
+    print '{0} texts, {1:.1f} MB'.format(len(texts), megabytes)
+
+    pairs = [('wordpunct', WordPunctTokenizer().tokenize, scrub.WORDPUNCT_RE.findall)]
+
+    if scrub.PunktWordTokenizer != None:
+        pairs.append(('punktword', scrub.PunktWordTokenizer().tokenize, scrub.PUNKTWORD_RE.findall))
+    else:
+        print 'PunktWordTokenizer is not in this NLTK version, only timing the regex version'
+        pairs.append(('punktword', None, scrub.PUNKTWORD_RE.findall))
+
+    for name, reference, regex in pairs:
+
+        ntokens = countTokens(regex, texts)
+
+        if reference == None:
+            regextime = timeFunction(regex, texts, args.repeats)
+            print '{0}: regex {1:.0f} tokens/s, {2:.2f} MB/s'.format(name, ntokens/regextime, megabytes/regextime)
+            continue
+
+        mismatches = sum(1 for t in texts if reference(t) != regex(t))
+
+        if mismatches:
+            print '{0}: {1} texts tokenized differently'.format(name, mismatches)
+            continue
+
+        referencetime = timeFunction(reference, texts, args.repeats)
+        regextime = timeFunction(regex, texts, args.repeats)
+
+        print '{0}: nltk {1:.0f} tokens/s, regex {2:.0f} tokens/s ({3:.1f}x), {4} tokens identical'.format(name,
+            ntokens/referencetime, ntokens/regextime, referencetime/regextime, ntokens)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/env/python
+
+"""Persistent store of the stemmed tokens of each email.
+
+create_dic.py, create_corpus.py and nb_ilan.py all stem the same emails. Run
+with --tokenstore, the token store keeps the result of the first run so the
+later ones can read the tokens back instead of stemming again.
+
+Each preprocessing configuration (see stemming.Preprocessor.config) gets its own
+directory, named after a hash of the configuration, so changing the stopwords,
+the abbreviation or n-gram files, the tokenizer or the stemmer starts a new,
+empty store instead of returning stale tokens. Inside it:
+
+vocab.txt   one token per line, the line number is the token id
+tokens.bin  one record per email: email id, md5 of the text, number of tokens
+            (little endian uint32, 16 bytes, uint32) followed by the token ids
+            (uint32 each, native byte order)
+
+Both files are only ever appended to, under an exclusive lock, so several
+processes can share a store. A record is only returned if the md5 of the text
+matches, so an email whose text changed is simply stemmed again.
+"""
+
+import fcntl
+import hashlib
+import os
+import struct
+from array import array
+
+
+HEADER = struct.Struct('<I16sI')
+
+def configKey(config):
+
+    """Short hash identifying a preprocessing configuration (a dict)"""
+
+    return hashlib.md5(repr(sorted(config.items()))).hexdigest()[:16]
+
+def textDigest(text):
+
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+
+    return hashlib.md5(text).digest()
+
+class TokenStore(object):
+
+    def __init__(self, directory, config):
+
+        self.key = configKey(config)
+        self.path = os.path.join(directory, self.key)
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        configfile = os.path.join(self.path, 'config.txt')
+
+        if not os.path.exists(configfile):
+            with open(configfile, 'w') as f:
+                for name, value in sorted(config.items()):
+                    f.write('{0}: {1!r}\n'.format(name, value))
+
+        self.vocabfile = os.path.join(self.path, 'vocab.txt')
+        self.recordfile = os.path.join(self.path, 'tokens.bin')
+
+        # token <-> id, and email id -> (md5 of the text, offset of the token ids, number of tokens)
+        self.tokens = []
+        self.token_ids = {}
+        self.index = {}
+
+        self.vocab_offset = 0
+        self.record_offset = 0
+
+        self.vocab = open(self.vocabfile, 'a+b')
+        self.records = open(self.recordfile, 'a+b')
+
+        self.lock()
+        try:
+            self.refresh(repair=True)
+        finally:
+            self.unlock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def lock(self):
+        fcntl.flock(self.vocab, fcntl.LOCK_EX)
+
+    def unlock(self):
+        fcntl.flock(self.vocab, fcntl.LOCK_UN)
+
+    def refresh(self, repair=False):
+
+        """Read whatever other processes appended since the last refresh. With repair=True
+        (only while holding the lock) a token or a record cut short by a crash is removed"""
+
+        self.vocab.seek(self.vocab_offset)
+        data = self.vocab.read()
+        end = data.rfind('\n') + 1
+
+        for token in data[:end].split('\n')[:-1]:
+            self.token_ids[token] = len(self.tokens)
+            self.tokens.append(token)
+
+        self.vocab_offset += end
+
+        # a token cut short by a crash would be joined to the next one appended
+        if repair and data[end:]:
+            self.vocab.truncate(self.vocab_offset)
+
+        self.records.seek(self.record_offset)
+        offset = self.record_offset
+
+        while True:
+
+            header = self.records.read(HEADER.size)
+
+            if len(header) < HEADER.size:
+                break
+
+            id, digest, n = HEADER.unpack(header)
+
+            if len(self.records.read(4*n)) < 4*n:
+                break
+
+            self.index[id] = (digest, offset + HEADER.size, n)
+            offset += HEADER.size + 4*n
+
+        if repair and self.records.tell() > offset:
+            self.records.truncate(offset)
+
+        self.record_offset = offset
+
+        return
+
+    def get(self, id, text):
+
+        """Stored tokens of email id, or None if it is not stored or its text changed"""
+
+        entry = self.index.get(id)
+
+        if entry == None or entry[0] != textDigest(text):
+            self.misses += 1
+            return None
+
+        digest, offset, n = entry
+
+        self.records.seek(offset)
+        ids = array('I')
+        ids.fromstring(self.records.read(4*n))
+
+        tokens = self.tokens
+        self.hits += 1
+
+        return [tokens[i] for i in ids]
+
+    def put(self, id, text, tokens):
+
+        """Store the tokens of email id"""
+
+        tokens = [t.encode('utf-8') if isinstance(t, unicode) else t for t in tokens]
+
+        self.lock()
+
+        try:
+
+            self.refresh()
+
+            new = []
+
+            for token in tokens:
+                if token not in self.token_ids:
+                    self.token_ids[token] = len(self.tokens)
+                    self.tokens.append(token)
+                    new.append(token)
+
+            if new:
+                data = ''.join(token + '\n' for token in new)
+                self.vocab.seek(0, os.SEEK_END)
+                self.vocab.write(data)
+                self.vocab.flush()
+                self.vocab_offset += len(data)
+
+            ids = array('I', [self.token_ids[token] for token in tokens])
+            digest = textDigest(text)
+
+            self.records.seek(0, os.SEEK_END)
+            self.records.write(HEADER.pack(id, digest, len(ids)) + ids.tostring())
+            self.records.flush()
+
+            self.index[id] = (digest, self.record_offset + HEADER.size, len(ids))
+            self.record_offset += HEADER.size + 4*len(ids)
+
+        finally:
+
+            self.unlock()
+
+        return
+
+    def close(self):
+
+        self.vocab.close()
+        self.records.close()
+
+        return
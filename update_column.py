@@ -12,12 +12,21 @@ import enron
 import createdb
 import re
 import logging
+import multiprocessing
+import time
 import pdb
 
 parser = argparse.ArgumentParser("Update a column in an existing database")
 parser.add_argument("-n", "--name", help = 'Database name', required = True, type = str)
 parser.add_argument("-t", "--table", help = 'Table name', required = True, type = str)
 parser.add_argument("-c", "--column", help = 'Column name', required = True, type =str)
+parser.add_argument("-b", "--batched", help = 'Read and write the table in chunks, cleaning each chunk in parallel',
+                    default = False, action = 'store_true')
+parser.add_argument("-w", "--workers", help = 'Number of cleaning processes in batched mode (default: all cores)',
+                    default = None, type = int)
+parser.add_argument("--chunk", help = 'Number of rows per chunk in batched mode', default = 1000, type = int)
+parser.add_argument("-r", "--resume-from", help = 'Only update rows with an id greater than this',
+                    default = 0, type = int, dest = 'resume_from')
 
 
 
@@ -26,65 +35,62 @@ def ultraClean(textstring):
 
     """Extra cleaning the text"""
 
-    textstring = textstring.lower()
+    return enron.ultraClean(textstring)
 
-    #first remove all the \n and unicode remnants
 
-    textstring = enron.stripCharacters(textstring)
+def batchedUpdate(connection, cursor, table, column, chunk=1000, workers=None, resume_from=0):
 
+    """Rewrite column from rawtext a chunk at a time. Rows are read in id order with keyset
+    pagination (where id > last id) so every chunk is an index range scan, cleaned in a
+    process pool and written back with one executemany and one commit per chunk.
+    If it stops, run again with resume_from set to the last id printed"""
 
-    match = re.search(r'Original Message', textstring)
+    select = "select id, rawtext from {0} where id > %s order by id limit %s".format(table)
+    update = "UPDATE {0} set {1}=%s where `id` = %s".format(table, column)
 
-    #match.start is the index of the first occurance of the search string. Want the 
-    #message from the beginning to that point
+    if workers == None:
+        workers = multiprocessing.cpu_count()
 
-    if (match==None):
-        textstring = textstring
-    else:
-        textstring = textstring[:match.start()]
+    pool = multiprocessing.Pool(processes = workers)
 
-    #next remove any email addresses
-    #sometimes they are not xxx@enron.com, but Name/HOU/ECT@ECT so need to include
-    #internal messages
-    textstring = re.sub(r"[a-z,A-Z,0-9,/]+@+[\w]+", r' ', textstring)
-    textstring = re.sub(r'/HOU/ECT', r'', textstring)
-    
-    #proper emails
-    textstring = re.sub(r"[a-z,A-Z,0-9,/,.]+@+[\w]+.\w*", r' ', textstring)
-    #relic html tags
-    textstring = re.sub(r"<(|/)\w+>", r' ', textstring)
-    #websites
-    #this isn't going to be perfect but I think it's good enough in this case
-    #there are pages of discussions about what to do with regex to extract
-    #urls on the internet and none of them work on everything
-    #this works on anything starting http(s) or www.
-    textstring = re.sub(r"(?:http(s)?://|www.)\S+", r'  ', textstring)
+    lastid = resume_from
+    updated = 0
+    start = time.time()
 
-    #times
+    try:
 
-    textstring = re.sub(r"\d{2}(:|\s)\d{2}\s(p|a)m", r' ', textstring)
+        while True:
 
-    #dates
+            cursor.execute(select, (lastid, chunk))
+            rows = cursor.fetchall()
 
-    textstring = re.sub(r"\d{2}/\d{2}/\d{4}", r' ', textstring)
-    #attachment names
-    textstring = re.sub(r"[0-9,a-z,.,_]*.pdf",r' ',textstring)
-    textstring = re.sub(r"[0-9,a-z,.,_]*.doc",r' ',textstring)
+            if not rows:
+                break
 
-    textstring = re.sub(r"\d{3}(-|\s)\d{3}(-|\s)\d{4}", r'  ', textstring)
+            ids = [row[0] for row in rows]
+            cleantexts = pool.map(ultraClean, [row[1] for row in rows], chunksize = max(1, len(rows)/(4*workers)))
 
+            cursor.executemany(update, zip(cleantexts, ids))
+            connection.commit()
 
-    #assorted punctuation punctuation
-    textstring = re.sub('[\^~+=!-*@#$<>.,;:?!|\-\(\)/"\'\[\]]', r' ' , textstring)
-    
-    #finally any character which repeats >2 times
-    #will remove any extra whitespace for example
-    textstring = re.sub(r'(.)\1{2,}', r' ', textstring)
+            lastid = ids[-1]
+            updated += len(ids)
+
+            elapsed = time.time() - start
+            print 'Updated up to id {0}: {1} rows ({2:.1f} rows/sec)'.format(lastid, updated, updated/elapsed)
+
+        pool.close()
+
+    except:
 
+        pool.terminate()
+        raise
 
+    finally:
 
-    return textstring
+        pool.join()
 
+    return updated
 
 def main():
 
@@ -94,6 +100,15 @@ def main():
 
     connection, cursor = enron.connectDB(args.name)
 
+    if args.batched:
+
+        batchedUpdate(connection, cursor, args.table, args.column, chunk = args.chunk,
+            workers = args.workers, resume_from = args.resume_from)
+
+        connection.close()
+
+        return
+
     cursor.execute("select ID from emails order by id desc limit 1;")
     #cursor.execute("select ID from {0} order by id desc limit 1;".format(args.table))
     numrows = int(cursor.fetchone()[0])
@@ -103,7 +118,7 @@ def main():
     #but it won't make your computer slow down and explode
 
     
-    for id in range(1, numrows+1):
+    for id in range(args.resume_from+1, numrows+1):
         
         #fetch the rawtext
 